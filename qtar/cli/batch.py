@@ -0,0 +1,258 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from queue import Queue
+from threading import Thread, Lock
+from timeit import default_timer as timer
+
+from PIL import Image
+
+from qtar.core.qtar import QtarStego, DEFAULT_PARAMS
+from qtar.core.batch import iter_embed, iter_extract
+from qtar.cli.qtarargparser import get_qtar_argpaser, get_qtar_params, validate_params
+from qtar.utils import save_file, print_progress_bar, format_time
+
+EMBED_COLUMNS = ('container', 'secret', 'stego', 'key')
+EXTRACT_COLUMNS = ('stego', 'key', 'output')
+
+MANIFEST_HELP = """Manifest of images, CSV with header or JSON lines.
+Paths are relative to the manifest directory.
+Columns of embed-batch: {embed}.
+Columns of extract-batch: {extract}.
+Other columns named as QTAR params (e.g. pm_mode, homogeneity_threshold)
+override params of the row, CSV values are parsed as JSON.""".format(embed=', '.join(EMBED_COLUMNS),
+                                                                    extract=', '.join(EXTRACT_COLUMNS))
+
+
+def get_embed_batch_argparser():
+    argparser = get_qtar_argpaser(with_images=False)
+    add_batch_arguments(argparser)
+    return argparser
+
+
+def get_extract_batch_argparser():
+    argparser = argparse.ArgumentParser(add_help=False,
+                                        formatter_class=argparse.RawTextHelpFormatter)
+    add_batch_arguments(argparser)
+    return argparser
+
+
+def add_batch_arguments(argparser):
+    argparser.add_argument('manifest',
+                           metavar='MANIFEST',
+                           type=str,
+                           help=MANIFEST_HELP)
+
+    argparser.add_argument('-P', '--processes',
+                           metavar='PROCESSES',
+                           type=int,
+                           default=None,
+                           help='Count of worker processes, \n'
+                                'count of CPUs by default.')
+
+    argparser.add_argument('--chunk',
+                           dest='chunksize',
+                           metavar='CHUNK_SIZE',
+                           type=int,
+                           default=1,
+                           help='Count of rows sent to worker process at once.')
+
+    argparser.add_argument('--queue',
+                           dest='queue_size',
+                           metavar='QUEUE_SIZE',
+                           type=int,
+                           default=8,
+                           help='Max count of images waiting between \n'
+                                'reading, processing and writing.')
+
+
+def embed_batch(params):
+    qtar_params = get_qtar_params(params)
+    manifest_dir = os.path.dirname(params['manifest'])
+
+    def read_row(row):
+        qtar = QtarStego(**row_params(qtar_params, row))
+        img_container = open_image(row_path(row, 'container', manifest_dir))
+        img_watermark = open_image(row_path(row, 'secret', manifest_dir))
+        return qtar, img_container, img_watermark
+
+    def write_row(row, result):
+        save_file(result.img_stego, row_path(row, 'stego', manifest_dir))
+        write_bytes(result.key_bytes, row_path(row, 'key', manifest_dir))
+
+    def process(items):
+        return iter_embed(items, params['processes'], params['chunksize'])
+
+    return run_pipeline('embed-batch', read_manifest(params['manifest']), read_row, process, write_row,
+                        params['queue_size'])
+
+
+def extract_batch(params):
+    manifest_dir = os.path.dirname(params['manifest'])
+
+    def read_row(row):
+        img_stego = open_image(row_path(row, 'stego', manifest_dir))
+        with open(row_path(row, 'key', manifest_dir), 'rb') as file:
+            key_bytes = file.read()
+        return QtarStego, img_stego, key_bytes
+
+    def write_row(row, result):
+        save_file(result.img_secret, row_path(row, 'output', manifest_dir))
+
+    def process(items):
+        return iter_extract(items, params['processes'], params['chunksize'])
+
+    return run_pipeline('extract-batch', read_manifest(params['manifest']), read_row, process, write_row,
+                        params['queue_size'])
+
+
+def run_pipeline(name, rows, read_row, process, write_row, queue_size):
+    """
+    Reads images of rows in one thread, processes them by process and writes results in another thread.
+    Stages are connected by queues of queue_size, so reading and writing go while images are processed.
+    Returns stats of the run.
+    """
+    stats = BatchStats(name, len(rows))
+    read_queue = Queue(queue_size)
+    write_queue = Queue(queue_size)
+
+    def read():
+        for i, row in enumerate(rows):
+            try:
+                read_queue.put((i, row, read_row(row)))
+            except Exception as e:
+                stats.fail(i, e)
+        read_queue.put(None)
+
+    # rows of items given to process, its results go in the same order
+    processed_rows = deque()
+
+    def items():
+        for i, row, item in iter(read_queue.get, None):
+            processed_rows.append((i, row))
+            yield item
+
+    def write():
+        for i, row, result in iter(write_queue.get, None):
+            try:
+                write_row(row, result)
+                stats.done()
+            except Exception as e:
+                stats.fail(i, e)
+
+    reader = Thread(target=read, daemon=True)
+    writer = Thread(target=write, daemon=True)
+    reader.start()
+    writer.start()
+
+    for result in process(items()):
+        i, row = processed_rows.popleft()
+        if result.ok:
+            write_queue.put((i, row, result))
+        else:
+            stats.fail(i, result.error)
+
+    write_queue.put(None)
+    reader.join()
+    writer.join()
+    stats.print_summary()
+    return stats
+
+
+class BatchStats:
+    """Counts of done and failed rows of batch printed to stderr with progress and throughput."""
+    def __init__(self, name, total):
+        self.name = name
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.start = timer()
+        self.lock = Lock()
+
+    @property
+    def finished(self):
+        return self.succeeded + self.failed
+
+    @property
+    def elapsed(self):
+        return timer() - self.start
+
+    @property
+    def throughput(self):
+        return self.finished / self.elapsed if self.elapsed else 0
+
+    def done(self):
+        with self.lock:
+            self.succeeded += 1
+            self.print_progress()
+
+    def fail(self, i, error):
+        with self.lock:
+            self.failed += 1
+            print('\nrow %d failed: %s' % (i + 1, error), file=sys.stderr)
+            self.print_progress()
+
+    def print_progress(self):
+        print_progress_bar(self.finished, self.total, self.elapsed / self.finished, prefix=self.name,
+                           suffix='%.2f images/s' % self.throughput, file=sys.stderr)
+
+    def print_summary(self):
+        print('%s: %d done, %d failed of %d in %s, %.2f images/s' %
+              (self.name, self.succeeded, self.failed, self.total, format_time(self.elapsed), self.throughput),
+              file=sys.stderr)
+
+
+def read_manifest(path):
+    """
+    Rows of manifest as dicts, CSV files are read by header, any other file as JSON lines.
+    CSV values of QTAR params are parsed as JSON, paths and other columns are kept as they are.
+    """
+    with open(path, newline='') as file:
+        if path.lower().endswith('.csv'):
+            return [{column: parse_value(value) if column in DEFAULT_PARAMS else value or None
+                     for column, value in row.items()}
+                    for row in csv.DictReader(file)]
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def parse_value(value):
+    if value is None or value == '':
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def row_params(params, row):
+    """Params overridden by columns of the row."""
+    overrides = {name: row[name] for name in DEFAULT_PARAMS if row.get(name) is not None}
+    return get_qtar_params(validate_params(dict(params, **overrides)))
+
+
+def row_path(row, column, manifest_dir):
+    path = row.get(column)
+    if not path:
+        raise WrongManifestError('Wrong manifest: column %s is required.' % column)
+    return os.path.join(manifest_dir, path)
+
+
+def open_image(path):
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def write_bytes(data, path):
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+class WrongManifestError(Exception):
+    pass
@@ -1,9 +1,12 @@
 import argparse
 
+from qtar.core.transform import BACKENDS, FFTPACK, set_default_backend
 from qtar.cli.qtarargparser import validate_params
 from qtar.cli.embed import embed, get_embed_argparser
 from qtar.cli.extract import extract, get_extract_argparser
 from qtar.cli.test import test, get_test_params
+from qtar.cli.batch import embed_batch, extract_batch, get_embed_batch_argparser, get_extract_batch_argparser
+from qtar.cli.serve import serve, get_serve_argparser
 
 
 def main():
@@ -12,6 +15,13 @@ def main():
                                         description='Steganography utility for embedding/extracting secret images'
                                                     'into another images using QTAR algorithm and its modifications.')
 
+    argparser.add_argument('--transform',
+                           metavar='BACKEND',
+                           type=str,
+                           choices=sorted(BACKENDS),
+                           default=FFTPACK,
+                           help='DCT backend, one of: ' + ', '.join(sorted(BACKENDS)) + '.')
+
     subparsers = argparser.add_subparsers(help='Available commands')
 
     embed_parser = subparsers.add_parser('embed',
@@ -36,12 +46,38 @@ def main():
                                         formatter_class=argparse.RawTextHelpFormatter)
     test_parser.set_defaults(command='test')
 
+    embed_batch_parser = subparsers.add_parser('embed-batch',
+                                               help='embed secret images into containers listed in manifest',
+                                               description='This command embeds secret images into containers\n'
+                                                           'listed in manifest by pool of worker processes.',
+                                               parents=[get_embed_batch_argparser()],
+                                               formatter_class=argparse.RawTextHelpFormatter)
+    embed_batch_parser.set_defaults(command='embed-batch')
+
+    extract_batch_parser = subparsers.add_parser('extract-batch',
+                                                 help='extract images from stego-images listed in manifest',
+                                                 description='This command extracts secret images from\n'
+                                                             'stego-images listed in manifest by pool of worker processes.',
+                                                 parents=[get_extract_batch_argparser()],
+                                                 formatter_class=argparse.RawTextHelpFormatter)
+    extract_batch_parser.set_defaults(command='extract-batch')
+
+    serve_parser = subparsers.add_parser('serve',
+                                         help='serve embedding and extraction over local HTTP',
+                                         description='This command serves embed, extract and capacity\n'
+                                                     'requests over local HTTP or unix socket.',
+                                         parents=[get_serve_argparser()],
+                                         formatter_class=argparse.RawTextHelpFormatter)
+    serve_parser.set_defaults(command='serve')
+
     args = argparser.parse_args()
 
     if not hasattr(args, 'command'):
         argparser.print_help()
         return
 
+    set_default_backend(args.transform)
+
     try:
         if args.command == 'embed':
             params = validate_params(vars(args))
@@ -53,6 +89,16 @@ def main():
         elif args.command == 'test':
             params = validate_params(vars(args))
             test(params)
+
+        elif args.command == 'embed-batch':
+            params = validate_params(vars(args))
+            embed_batch(params)
+
+        elif args.command == 'extract-batch':
+            extract_batch(vars(args))
+
+        elif args.command == 'serve':
+            serve(vars(args))
     except Exception as e:
         print(e)
 
@@ -1,9 +1,10 @@
 from PIL import Image
 
 from qtar.core.qtar import QtarStego, NoSpaceError
+from qtar.core.cache import AnalysisCache
 from qtar.optimization.metrics import psnr, ssim
 from qtar.utils import benchmark, extract_filename, save_file
-from qtar.cli.qtarargparser import get_qtar_argpaser
+from qtar.cli.qtarargparser import get_qtar_argpaser, get_qtar_params
 
 METRICS_INFO_TEMPLATE = """
 PSNR container: {psnr_container:.4f}
@@ -43,6 +44,19 @@ def get_embed_argparser():
                            default='key.qtarkey',
                            help='Path to save key.')
 
+    argparser.add_argument('--plan',
+                           metavar='PLAN_FILE',
+                           type=str,
+                           default=None,
+                           help='Path to save embedding plan to speed up extraction.')
+
+    argparser.add_argument('--cache',
+                           metavar='CACHE_DIR',
+                           type=str,
+                           default=None,
+                           help='Directory to cache analysis of containers \n'
+                                'between runs with the same parameters.')
+
     return argparser
 
 
@@ -54,11 +68,12 @@ def embed(params):
     if params['watermark_size']:
         watermark = watermark.resize(params['watermark_size'], Image.BILINEAR)
 
-    qtar = QtarStego(**params)
+    qtar = QtarStego(**get_qtar_params(params))
+    cache = AnalysisCache(params['cache']) if params['cache'] else None
 
     try:
         with benchmark("Embedded in "):
-            embed_result = qtar.embed(container, watermark, stages=True)
+            embed_result = qtar.embed(container, watermark, cache=cache)
     except NoSpaceError as e:
         print(e)
         return
@@ -73,6 +88,8 @@ def embed(params):
 
     save_file(stego, stego_path)
     save_file(key, params['key'])
+    if params['plan']:
+        save_file(embed_result.plan, params['plan'])
 
     bpp_ = embed_result.bpp
     psnr_container = psnr(container, stego)
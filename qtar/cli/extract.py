@@ -3,6 +3,7 @@ from PIL import Image
 
 from qtar.core.qtar import QtarStego
 from qtar.core.container import Key
+from qtar.core.embeddingplan import EmbeddingPlan
 from qtar.utils import benchmark, extract_filename, save_file
 
 
@@ -27,15 +28,28 @@ def get_extract_argparser():
                            type=str,
                            help='path to save extracted image')
 
+    argparser.add_argument('--plan',
+                           metavar='PLAN_FILE',
+                           type=str,
+                           default=None,
+                           help='path to embedding plan saved with the key')
+
+    argparser.add_argument('-j', '--workers',
+                           metavar='WORKERS',
+                           type=int,
+                           default=None,
+                           help='process channels of stego image in parallel threads')
+
     return argparser
 
 
 def extract(params):
     key = Key.open(params['key'])
+    plan = EmbeddingPlan.open(params['plan'], key) if params['plan'] else None
     stego_image = Image.open(params['stego'])
 
     with benchmark("extracted in"):
-        secret_image = QtarStego.extract(stego_image, key)
+        secret_image = QtarStego.extract(stego_image, key, plan=plan, workers=params['workers'])
 
     if params['wm_path']:
         si_path = params['wm_path']
@@ -1,8 +1,8 @@
 import argparse
-import math
-from copy import copy
 
 from qtar.core.qtar import DEFAULT_PARAMS
+from qtar.core.homogeneity import CRITERIA
+from qtar.core.params import QTAR_ARGS, get_qtar_params, validate_params, is_power_of, WrongQTARParamError
 
 
 def get_qtar_argpaser(with_images=True):
@@ -29,6 +29,15 @@ def get_qtar_argpaser(with_images=True):
                                 'for different brightness levels, \n'
                                 'real, 0 <= th <= 1.')
 
+    argparser.add_argument('--hc', '--criterion',
+                           dest='homogeneity_criterion',
+                           metavar='CRITERION',
+                           type=str,
+                           choices=CRITERIA,
+                           default=DEFAULT_PARAMS['homogeneity_criterion'],
+                           help='Homogeneity criterion of quad-tree blocks (hc), \n'
+                                'one of: ' + ', '.join(CRITERIA) + '.')
+
     argparser.add_argument('-b', '--min-b',
                            dest='min_block_size',
                            metavar='MIN_BLOCK_SIZE',
@@ -47,6 +56,15 @@ def get_qtar_argpaser(with_images=True):
                                 'integer, min_b <= max_b <= container size,\n '
                                 'power of 2.')
 
+    argparser.add_argument('--tile',
+                           dest='tile_size',
+                           metavar='TILE_SIZE',
+                           type=int,
+                           default=DEFAULT_PARAMS['tile_size'],
+                           help='Split container into square tiles with own quad trees \n'
+                                'instead of resizing it to a square, \n'
+                                'integer, min_b <= tile, power of 2.')
+
     argparser.add_argument('-q', '--quantization',
                            dest='quant_power',
                            metavar='QUANTIZATION_POWER',
@@ -110,58 +128,10 @@ def get_qtar_argpaser(with_images=True):
                            help='Scale factor for secret image DCT coefficients (sk), \n'
                                 'real, 0 < sk <= 1.')
 
-    return argparser
-
-
-def validate_params(given_params):
-    params = copy(DEFAULT_PARAMS)
-    params.update(given_params)
-
-    th = params['homogeneity_threshold']
-    min_b = params['min_block_size']
-    max_b = params['max_block_size']
-    q = params['quant_power']
-    s = params['ch_scale']
-    cf_g = params['cf_grid_size']
-    wmdct_b = params['wmdct_block_size']
-    wmdct_s = params['wmdct_scale']
-
-    if isinstance(th, (tuple, list)) and not all(0 <= t <= 1 for t in th) \
-            or isinstance(th, (float, int)) and not 0 <= th <= 1:
-        raise WrongQTARParamError('Wrong argument: threshold (th) must be real in range 0 <= th <= 1.')
-
-    if not (8 <= min_b <= max_b and is_power_of(min_b, 2)):
-        raise WrongQTARParamError('Wrong argument: min block size (min_b) must be integer in range '
-                                  '8 <= min_b <= max_b and power of 2.')
-
-    if not (min_b <= max_b and is_power_of(max_b, 2)):
-        raise WrongQTARParamError('Wrong argument: max block size (max_b) must be integer in range '
-                                  'min_b <= max_b <= container_size and power of 2.')
-
-    if not 0 < q <= 1:
-        raise WrongQTARParamError('Wrong argument: quantization power (q) must be real in range 0 < q <= 1.')
-
-    if not 0 < s <= 20:
-        raise WrongQTARParamError('Wrong argument: scale factor (k) must be real in range 0 < k <= 20.')
-
-    if not 1 <= cf_g <= min_b:
-        raise WrongQTARParamError('Wrong argument: curve-fitting grid (cf) must be integer in range 1 <= cf <= min_b.')
-
-    if not 1 <= wmdct_b:
-        raise WrongQTARParamError('Wrong argument: secret image DCT block size (v) must be integer in range '
-                                  '1 <= v <= secret-image size.')
-
-    if not 0 < wmdct_s <= 1:
-        raise WrongQTARParamError('Wrong argument: scale factor for secret image DCT coefficients (sk) '
-                                  'must be real in range 0 < sk <= 1.')
-
-    return params
-
-
-def is_power_of(value, base):
-    power = int(math.log(value, base))
-    return value == base**power
-
+    argparser.add_argument('-j', '--workers',
+                           metavar='WORKERS',
+                           type=int,
+                           default=None,
+                           help='Process channels of images in parallel threads.')
 
-class WrongQTARParamError(Exception):
-    pass
+    return argparser
@@ -0,0 +1,58 @@
+import argparse
+import sys
+
+from qtar.server import make_server, DEFAULT_HOST, DEFAULT_PORT, PREPARED_CACHE_SIZE
+
+
+def get_serve_argparser():
+    argparser = argparse.ArgumentParser(add_help=False,
+                                        formatter_class=argparse.RawTextHelpFormatter)
+
+    argparser.add_argument('--host',
+                           metavar='HOST',
+                           type=str,
+                           default=DEFAULT_HOST,
+                           help='Host to listen on, local only by default.')
+
+    argparser.add_argument('--port',
+                           metavar='PORT',
+                           type=int,
+                           default=DEFAULT_PORT,
+                           help='Port to listen on.')
+
+    argparser.add_argument('--socket',
+                           dest='socket_path',
+                           metavar='SOCKET_PATH',
+                           type=str,
+                           default=None,
+                           help='Listen on unix socket instead of host and port.')
+
+    argparser.add_argument('-j', '--workers',
+                           metavar='WORKERS',
+                           type=int,
+                           default=None,
+                           help='Count of worker threads.')
+
+    argparser.add_argument('--cache-size',
+                           metavar='CACHE_SIZE',
+                           type=int,
+                           default=PREPARED_CACHE_SIZE,
+                           help='Count of prepared containers kept between requests.')
+
+    argparser.add_argument('-q', '--quiet',
+                           action='store_true',
+                           help='Do not log requests.')
+
+    return argparser
+
+
+def serve(params):
+    server = make_server(params['host'], params['port'], params['socket_path'], params['workers'],
+                         params['cache_size'], params['quiet'])
+    print('serving on %s' % (server.server_address,), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
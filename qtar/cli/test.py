@@ -3,6 +3,7 @@ import os
 from PIL import Image
 
 from qtar.cli.embed import get_embed_argparser
+from qtar.cli.qtarargparser import get_qtar_params
 from qtar.core.container import Key
 from qtar.core.qtar import QtarStego, NoSpaceError
 from qtar.optimization.metrics import psnr, bcr, ssim
@@ -17,6 +18,7 @@ pm mode:               {pm_mode}
 cf mode:               {cf_mode}
 wmdct mode:            {wmdct_mode}
 threshold:             {homogeneity_threshold}
+criterion:             {homogeneity_criterion}
 min - max block sizes: {min_block_size} - {max_block_size}
 SI block size:         {wmdct_block_size}
 quantization power:    {quant_power:.2f}
@@ -71,7 +73,7 @@ def test(params):
     embedding_info = EMBEDDING_INFO_TEMPLATE.format(**params)
     print(embedding_info)
 
-    qtar = QtarStego(**params)
+    qtar = QtarStego(**get_qtar_params(params))
 
     try:
         with benchmark("embedded in "):
@@ -1,3 +1,4 @@
+import numpy as np
 from numpy import uint8
 
 from qtar.core.quantizationmatrix import generate_quantization_matrix
@@ -12,23 +13,29 @@ def adapt_regions(regions, q_power=None, ar_indexes=None):
 
 
 def _find_ar_indexes(regions, q_power):
-    ar_indexes = list()
-    for region in regions:
-        h, w = region.shape
-        if h != w:
-            raise RegionShapeError("Regions must have square shape")
-        size = h
-        quantization_matrix = generate_quantization_matrix(size)
-        quantized = uint8(region / (quantization_matrix * q_power))
-        if quantized[-1, -1] != 0:
-            ar_indexes.append(size)
-            continue
-        for xy in range(0, size):
-            aregion = quantized[xy:size][xy:size]
-            if not aregion.any():
-                ar_indexes.append(xy)
-                break
-    return ar_indexes
+    """
+    Regions of one size are quantized together, the index of every region is the least xy
+    such that quantized rows from 2 * xy on are all zero, or size if the last coefficient is not zero.
+    """
+    height, width = regions.matrix.shape
+    rects = np.asarray(regions.rects, np.int64).reshape((-1, 4))
+    x0, y0 = np.minimum(rects[:, 0], width), np.minimum(rects[:, 1], height)
+    heights = np.maximum(np.minimum(rects[:, 3], height) - y0, 0)
+    widths = np.maximum(np.minimum(rects[:, 2], width) - x0, 0)
+    if (heights != widths).any():
+        raise RegionShapeError("Regions must have square shape")
+
+    ar_indexes = np.zeros(len(rects), np.int64)
+    for size in np.unique(heights[heights > 0]).tolist():
+        ids = np.flatnonzero(heights == size)
+        rows = y0[ids, None, None] + np.arange(size)[None, :, None]
+        cols = x0[ids, None, None] + np.arange(size)[None, None, :]
+        quantized = uint8(regions.matrix[rows, cols] / (generate_quantization_matrix(size) * q_power))
+
+        nonzero_rows = quantized.any(axis=2)
+        last_nonzero_row = np.where(nonzero_rows.any(axis=1), size - 1 - nonzero_rows[:, ::-1].argmax(axis=1), -1)
+        ar_indexes[ids] = np.where(quantized[:, -1, -1] != 0, size, (last_nonzero_row + 2) // 2)
+    return ar_indexes.tolist()
 
 
 def _adapt_by_ar_indexes(regions, ar_indexes):
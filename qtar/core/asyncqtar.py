@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from qtar.core.qtar import QtarStego
+
+
+class AsyncQtarStego:
+    """
+    QtarStego for asyncio: every stage of embedding and extraction runs in executor, the event loop never waits for it.
+
+    Executor is a pool of threads of its own by default, any concurrent.futures executor can be given instead,
+    with pool of processes images and prepared containers are pickled between stages.
+    At most max_in_flight jobs run at once, the others wait for their turn without taking executor.
+    Cancelled job stops between stages: prepared container of cancelled embedding is not embedded into,
+    restored stego image of cancelled extraction is not extracted from.
+    """
+    def __init__(self, qtar=None, executor=None, workers=None, max_in_flight=None):
+        self.qtar = qtar or QtarStego()
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(workers)
+        self.in_flight = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+
+    async def embed(self, img_container, img_watermark, resize_to_fit=True, cache=None):
+        async with self.slot():
+            prepared = await self.run_stage(self.qtar.prepare, img_container, cache)
+            return await self.run_stage(self.qtar.embed_prepared, prepared, img_watermark, resize_to_fit)
+
+    async def extract(self, img_stego, key, plan=None):
+        async with self.slot():
+            restored = await self.run_stage(type(self.qtar).restore, img_stego, key)
+            return await self.run_stage(type(self.qtar).extract_restored, restored, key, False, plan)
+
+    async def embed_many(self, pairs, resize_to_fit=True, return_exceptions=True):
+        """
+        Embeds secret images into containers of pairs (container, secret image) concurrently,
+        results are in order of pairs, errors are returned in place of results if return_exceptions is set.
+        """
+        return await asyncio.gather(*(self.embed(img_container, img_watermark, resize_to_fit)
+                                      for img_container, img_watermark in pairs),
+                                    return_exceptions=return_exceptions)
+
+    async def extract_many(self, items, return_exceptions=True):
+        """Extracts secret images from pairs (stego image, key) the same way as embed_many embeds them."""
+        return await asyncio.gather(*(self.extract(img_stego, key) for img_stego, key in items),
+                                    return_exceptions=return_exceptions)
+
+    def slot(self):
+        return self.in_flight or NoLimit()
+
+    async def run_stage(self, func, *args):
+        future = self.executor.submit(func, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # a stage already running can not be interrupted, the job keeps its slot until the stage ends
+            if not future.done():
+                await asyncio.wait([asyncio.wrap_future(future)])
+            raise
+
+    async def close(self):
+        if self.own_executor:
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class NoLimit:
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *args):
+        pass
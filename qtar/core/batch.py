@@ -0,0 +1,228 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from PIL import Image
+
+from qtar.core.container import Key
+
+
+class BatchEmbedResult:
+    """
+    Result of one pair of embed_many: pixels of stego image, serialized key and bpp,
+    or the error raised by embedding of the pair.
+    """
+    def __init__(self, stego=None, mode=None, key_bytes=None, bpp=None, error=None):
+        self.stego = stego
+        self.mode = mode
+        self.key_bytes = key_bytes
+        self.bpp = bpp
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def img_stego(self):
+        return Image.fromarray(self.stego, self.mode)
+
+    @property
+    def key(self):
+        return Key.from_bytes(self.key_bytes)
+
+
+class BatchExtractResult:
+    """Result of one stego image of extract_many: pixels of extracted secret image or the error raised."""
+    def __init__(self, secret=None, mode=None, error=None):
+        self.secret = secret
+        self.mode = mode
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def img_secret(self):
+        return Image.fromarray(self.secret, self.mode)
+
+
+def embed_many(qtar, pairs, workers=None, chunksize=1, resize_to_fit=True):
+    """
+    Embeds every secret image into its container by pool of processes, results are in order of pairs.
+    Pixels of images go to workers and back through shared memory.
+    """
+    return list(iter_embed(((qtar, img_container, img_watermark) for img_container, img_watermark in pairs),
+                           workers, chunksize, resize_to_fit))
+
+
+def extract_many(qtar_class, items, workers=None, chunksize=1):
+    """
+    Extracts secret images from pairs of stego image and its key (Key or bytes of it) by pool of processes,
+    results are in order of items.
+    """
+    return list(iter_extract(((qtar_class, img_stego, key) for img_stego, key in items), workers, chunksize))
+
+
+def iter_embed(items, workers=None, chunksize=1, resize_to_fit=True):
+    """
+    Embeds secret images of items (QtarStego, container, secret image), every item with its own parameters.
+    Items are read lazily and results are yielded in order of items as soon as they are ready.
+    """
+    def share_chunk(chunk):
+        images = [image for _, img_container, img_watermark in chunk for image in (img_container, img_watermark)]
+        return [image.mode for image in images], [np.asarray(image) for image in images]
+
+    def collect(chunk_results, arrays):
+        return [BatchEmbedResult(arrays[i], mode, key_bytes, bpp) if error is None else BatchEmbedResult(error=error)
+                for i, mode, key_bytes, bpp, error in chunk_results]
+
+    def qtars(chunk):
+        return [qtar for qtar, _, _ in chunk]
+
+    return imap_chunks(embed_chunk, share_chunk, collect, items, workers, chunksize,
+                       resize_to_fit, chunk_args=qtars, on_error=lambda error: BatchEmbedResult(error=error))
+
+
+def iter_extract(items, workers=None, chunksize=1):
+    """
+    Extracts secret images of items (QtarStego class, stego image, key) the same way as iter_embed embeds them.
+    """
+    def share_chunk(chunk):
+        return [img_stego.mode for _, img_stego, _ in chunk], [np.asarray(img_stego) for _, img_stego, _ in chunk]
+
+    def collect(chunk_results, arrays):
+        return [BatchExtractResult(arrays[i], mode) if error is None else BatchExtractResult(error=error)
+                for i, mode, error in chunk_results]
+
+    def classes_keys(chunk):
+        return [(qtar_class, key) for qtar_class, _, key in chunk]
+
+    return imap_chunks(extract_chunk, share_chunk, collect, items, workers, chunksize,
+                       chunk_args=classes_keys, on_error=lambda error: BatchExtractResult(error=error))
+
+
+def imap_chunks(func, share_chunk, collect, items, workers, chunksize, *args, chunk_args=None, on_error=None):
+    """
+    Runs func on chunks of items in pool of processes keeping at most two chunks per worker in flight,
+    yields results of items in their order.
+
+    share_chunk gives modes and pixels of images of a chunk, they are passed to func in shared memory
+    together with chunk_args of the chunk.
+    func returns shared arrays of its own and results of every item, collect turns them into results.
+    If whole chunk fails all its items get on_error of the error.
+    """
+    pending = deque()
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers) as executor:
+        def finish(future, chunk_size, shm):
+            try:
+                out_descriptor, chunk_results = future.result()
+                return collect(chunk_results, read_shared_arrays(out_descriptor, unlink=True))
+            except Exception as e:
+                return [on_error(e) for _ in range(chunk_size)]
+            finally:
+                shm.close()
+                shm.unlink()
+
+        try:
+            for chunk in chunks(items, chunksize):
+                modes, arrays = share_chunk(chunk)
+                shm, descriptor = share_arrays(arrays)
+                del arrays
+                pending.append((executor.submit(func, descriptor, modes, chunk_args(chunk), *args), len(chunk), shm))
+                if len(pending) >= max_pending:
+                    yield from finish(*pending.popleft())
+
+            while pending:
+                yield from finish(*pending.popleft())
+        finally:
+            # results of chunks still in flight are not needed when iteration is stopped
+            for future, _, shm in pending:
+                future.cancel()
+                shm.close()
+                shm.unlink()
+
+
+def embed_chunk(descriptor, modes, qtars, resize_to_fit):
+    images = [Image.fromarray(array, mode) for array, mode in zip(read_shared_arrays(descriptor), modes)]
+
+    results = []
+    stegos = []
+    for qtar, img_container, img_watermark in zip(qtars, images[::2], images[1::2]):
+        try:
+            result = qtar.embed(img_container, img_watermark, resize_to_fit)
+            results.append((len(stegos), result.img_stego.mode, result.key.to_bytes(), result.bpp, None))
+            stegos.append(np.asarray(result.img_stego))
+        except Exception as e:
+            results.append((None, None, None, None, e))
+
+    return hand_over(stegos), results
+
+
+def extract_chunk(descriptor, modes, classes_keys):
+    images = [Image.fromarray(array, mode) for array, mode in zip(read_shared_arrays(descriptor), modes)]
+
+    results = []
+    secrets = []
+    for img_stego, (qtar_class, key) in zip(images, classes_keys):
+        try:
+            if not isinstance(key, Key):
+                key = Key.from_bytes(key)
+            img_secret = qtar_class.extract(img_stego, key)
+            results.append((len(secrets), img_secret.mode, None))
+            secrets.append(np.asarray(img_secret))
+        except Exception as e:
+            results.append((None, None, e))
+
+    return hand_over(secrets), results
+
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def share_arrays(arrays):
+    """
+    Copies arrays into one new block of shared memory.
+    Returns the block and its descriptor to read the arrays in other process.
+    """
+    layout = []
+    size = 0
+    for array in arrays:
+        layout.append((array.shape, array.dtype.str, size))
+        size += array.nbytes
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for array, (shape, dtype, offset) in zip(arrays, layout):
+        np.ndarray(shape, dtype, shm.buf, offset)[...] = array
+    return shm, (shm.name, layout)
+
+
+def hand_over(arrays):
+    """Shares arrays with other process which reads and unlinks them, returns descriptor of the block."""
+    shm, descriptor = share_arrays(arrays)
+    shm.close()
+    return descriptor
+
+
+def read_shared_arrays(descriptor, unlink=False):
+    """Copies of arrays from block of shared memory by its descriptor."""
+    name, layout = descriptor
+    shm = SharedMemory(name)
+    try:
+        return [np.ndarray(shape, dtype, shm.buf, offset).copy() for shape, dtype, offset in layout]
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
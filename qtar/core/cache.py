@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_MAX_CACHE_SIZE = 1024 ** 3
+
+META_FILE = 'meta.json'
+
+TMP_PREFIX = '.tmp-'
+
+
+class ChannelAnalysis:
+    """
+    Everything embedding needs to know about one channel of a container besides its pixels:
+    quad tree, DCT of its regions and keys of adaptive regions or curve fitting.
+    """
+    def __init__(self, qt_key, rects, dct, ar_key=None, cf_key=None, permutation=None, tiles_shape=None):
+        self.qt_key = qt_key
+        self.rects = rects
+        self.dct = dct
+        self.ar_key = ar_key
+        self.cf_key = cf_key
+        self.permutation = permutation
+        self.tiles_shape = tiles_shape
+
+    def arrays(self):
+        arrays = {
+            'qt_key': np.asarray(self.qt_key, bool),
+            'rects': np.asarray(self.rects, np.int32).reshape((-1, 4)),
+            'dct': self.dct
+        }
+        if self.ar_key is not None:
+            arrays['ar_key'] = np.asarray(self.ar_key, np.int32)
+        if self.cf_key is not None:
+            arrays['cf_key'] = np.asarray(self.cf_key, np.int32).reshape((-1, 3))
+        if self.permutation is not None:
+            arrays['permutation'] = self.permutation
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, tiles_shape=None):
+        return cls(arrays['qt_key'].tolist(),
+                   [tuple(rect) for rect in arrays['rects'].tolist()],
+                   arrays['dct'],
+                   arrays['ar_key'].tolist() if 'ar_key' in arrays else None,
+                   [tuple(curve) for curve in arrays['cf_key'].tolist()] if 'cf_key' in arrays else None,
+                   arrays.get('permutation'),
+                   tiles_shape)
+
+
+class AnalysisCache:
+    """
+    Content-addressed directory of container analyses.
+
+    Every entry is a directory named by hash of container pixels and analysis params,
+    arrays are stored as .npy files and opened memory-mapped.
+    Least recently used entries are removed when total size of the cache exceeds max_size bytes.
+    """
+    def __init__(self, path, max_size=DEFAULT_MAX_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def digest(chs_image, params):
+        sha = hashlib.sha1()
+        sha.update(json.dumps([CACHE_FORMAT_VERSION, params], sort_keys=True, default=list).encode())
+        for ch_image in chs_image:
+            ch_image = np.ascontiguousarray(ch_image)
+            sha.update(str((ch_image.dtype.str, ch_image.shape)).encode())
+            sha.update(ch_image.data)
+        return sha.hexdigest()
+
+    def load(self, digest):
+        entry_path = os.path.join(self.path, digest)
+        try:
+            with open(os.path.join(entry_path, META_FILE)) as file:
+                meta = json.load(file)
+            chs_analysis = []
+            for ch, names in enumerate(meta['channels']):
+                arrays = {name: np.load(os.path.join(entry_path, '%d-%s.npy' % (ch, name)), mmap_mode='r')
+                          for name in names}
+                tiles_shape = tuple(meta['tiles_shape']) if meta['tiles_shape'] else None
+                chs_analysis.append(ChannelAnalysis.from_arrays(arrays, tiles_shape))
+            os.utime(entry_path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return chs_analysis
+
+    def store(self, digest, chs_analysis):
+        entry_path = os.path.join(self.path, digest)
+        tmp_path = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=self.path)
+        meta = {'channels': [], 'tiles_shape': chs_analysis[0].tiles_shape}
+        for ch, analysis in enumerate(chs_analysis):
+            arrays = analysis.arrays()
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, '%d-%s.npy' % (ch, name)), array)
+            meta['channels'].append(sorted(arrays))
+        with open(os.path.join(tmp_path, META_FILE), 'w') as file:
+            json.dump(meta, file)
+
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # the same entry is already stored by someone else
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            entry_path = os.path.join(self.path, name)
+            if name.startswith(TMP_PREFIX) or not os.path.isdir(entry_path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_path, file_name))
+                           for file_name in os.listdir(entry_path))
+                entries.append((os.path.getmtime(entry_path), size, entry_path))
+            except OSError:
+                # the entry is being removed by someone else
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
+
+    @property
+    def size(self):
+        return sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, files in os.walk(self.path)
+                   for file_name in files)
+
+
+class ArraysCache:
+    """
+    LRU cache of read-only arrays limited by their total size in bytes.
+    Anything with nbytes and setflags as arrays have, like EmbeddingPlan, can be cached too.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.arrays = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, build):
+        """Array cached by key, built by build() if there is none."""
+        with self.lock:
+            array = self.arrays.get(key)
+            if array is not None:
+                self.arrays.move_to_end(key)
+                return array
+
+        array = build()
+        array.setflags(write=False)
+        with self.lock:
+            if key not in self.arrays:
+                self.arrays[key] = array
+                self.size += array.nbytes
+                # the last array is kept even if it is larger than the cache
+                while self.size > self.max_size and len(self.arrays) > 1:
+                    _, evicted = self.arrays.popitem(last=False)
+                    self.size -= evicted.nbytes
+        return array
+
+    def clear(self):
+        with self.lock:
+            self.arrays.clear()
+            self.size = 0
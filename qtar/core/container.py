@@ -1,11 +1,15 @@
 import struct
+from io import BytesIO
 
 import numpy as np
 
 from qtar.core.imageqt import parse_qt_key
 
 
-MODE_STRUCT = '=???'
+MODE_STRUCT = '=BBB'
+
+# spare bit of the pm mode byte, set only in keys of tiled containers, so keys of untiled ones keep their layout
+TILED_FLAG = 0x80
 
 PARAMS_STRUCT = '=fiiiib'
 
@@ -27,7 +31,9 @@ class Key:
                  cf_grid_size=None,
                  wmdct_mode=False,
                  wmdct_block_size=None,
-                 wmdct_scale=None
+                 wmdct_scale=None,
+                 tile_size=None,
+                 tiles_shape=None
                  ):
         self.chs_qt_key = chs_qt_key or []
         self.chs_pm_fix_key = chs_pm_fix_key or []
@@ -43,10 +49,16 @@ class Key:
         self.wmdct_mode = wmdct_mode
         self.wmdct_block_size = wmdct_block_size
         self.wmdct_scale = wmdct_scale
+        self.tile_size = tile_size
+        self.tiles_shape = tiles_shape
+
+    @property
+    def tiled(self):
+        return self.tile_size is not None
 
     @property
     def params_bytes(self):
-        bytes = struct.pack(MODE_STRUCT, self.pm_mode, self.cf_mode, self.wmdct_mode)
+        bytes = struct.pack(MODE_STRUCT, self.pm_mode | (TILED_FLAG if self.tiled else 0), self.cf_mode, self.wmdct_mode)
 
         chs_count = len(self.chs_qt_key)
         bytes += struct.pack(PARAMS_STRUCT,
@@ -63,6 +75,9 @@ class Key:
         if self.wmdct_mode:
             bytes += int_to_byte(self.wmdct_block_size)
 
+        if self.tiled:
+            bytes += int_to_byte(self.tile_size) + int_to_byte(self.tiles_shape[0]) + int_to_byte(self.tiles_shape[1])
+
         return bytes
 
     @staticmethod
@@ -136,82 +151,103 @@ class Key:
     def size(self):
         return self.params_size + self.qt_key_size + self.pm_fix_key_size + self.ar_key_size + self.cf_key_size
 
-    def save(self, path):
-        with open(path, 'wb') as file:
-            key_bytes = self.params_bytes
-            for ch_n in range(len(self.chs_qt_key)):
-                key_bytes += self.chs_qt_key_bytes[ch_n]
+    def to_bytes(self):
+        key_bytes = self.params_bytes
+        for ch_n in range(len(self.chs_qt_key)):
+            key_bytes += self.chs_qt_key_bytes[ch_n]
 
-                if self.cf_mode:
-                    key_bytes += self.chs_cf_key_bytes[ch_n]
-                else:
-                    key_bytes += self.chs_ar_key_bytes[ch_n]
+            if self.cf_mode:
+                key_bytes += self.chs_cf_key_bytes[ch_n]
+            else:
+                key_bytes += self.chs_ar_key_bytes[ch_n]
 
-                if self.pm_mode:
-                    key_bytes += self.chs_pm_fix_key_bytes[ch_n]
+            if self.pm_mode:
+                key_bytes += self.chs_pm_fix_key_bytes[ch_n]
+        return key_bytes
 
+    def save(self, path):
+        key_bytes = self.to_bytes()
+        with open(path, 'wb') as file:
             file.write(key_bytes)
         return len(key_bytes)
 
+    @classmethod
+    def from_bytes(cls, key_bytes):
+        return cls.read(BytesIO(key_bytes))
+
     @classmethod
     def open(cls, path):
         with open(path, 'rb') as file:
-            mode_bytes = file.read(struct.calcsize(MODE_STRUCT))
-            pm_mode, cf_mode, wmdct_mode = struct.unpack(MODE_STRUCT, mode_bytes)
+            return cls.read(file)
 
-            params_bytes = file.read(struct.calcsize(PARAMS_STRUCT))
-
-            scale, x, y, wm_w, wm_h, chs_count = struct.unpack(PARAMS_STRUCT, params_bytes)
+    @classmethod
+    def read(cls, file):
+        mode_bytes = file.read(struct.calcsize(MODE_STRUCT))
+        pm_byte, cf_mode, wmdct_mode = struct.unpack(MODE_STRUCT, mode_bytes)
+        pm_mode, tiled = bool(pm_byte & ~TILED_FLAG), bool(pm_byte & TILED_FLAG)
+        cf_mode, wmdct_mode = bool(cf_mode), bool(wmdct_mode)
+
+        params_bytes = file.read(struct.calcsize(PARAMS_STRUCT))
+
+        scale, x, y, wm_w, wm_h, chs_count = struct.unpack(PARAMS_STRUCT, params_bytes)
+
+        offset = x, y
+        wm_shape = wm_w, wm_h
+
+        container_shape = None
+        if pm_mode:
+            c_w = read_int(file)
+            c_h = read_int(file)
+            container_shape = c_w, c_h
+
+        cf_grid_size = None
+        if cf_mode:
+            cf_grid_size = read_int(file)
+
+        wmdct_block_size = None
+        ch_scale = None
+        wmdct_scale = None
+        if wmdct_mode:
+            wmdct_scale = scale
+            wmdct_block_size = read_int(file)
+        else:
+            ch_scale = scale
+
+        tile_size = None
+        tiles_shape = None
+        tiles_count = 1
+        if tiled:
+            tile_size = read_int(file)
+            tiles_shape = read_int(file), read_int(file)
+            tiles_count = tiles_shape[0] * tiles_shape[1]
+
+        chs_qt_key = []
+        chs_ar_key = []
+        chs_cf_key = []
+        chs_pm_fix_key = []
+
+        for ch in range(chs_count):
+            qt_key_bytes_size = read_int(file)
+            qt_key = read_bits(file, qt_key_bytes_size)
+            qt_key, block_count = parse_qt_key(qt_key, tiles_count)
+            chs_qt_key.append(qt_key)
 
-            offset = x, y
-            wm_shape = wm_w, wm_h
+            if cf_mode:
+                cf_key_flat = read_array(file, cls.cf_key_type(cf_grid_size), block_count * CF_POINTS_COUNT)
+                cf_key = [tuple(curve.astype(int)) for curve in np.split(cf_key_flat, block_count)]
+                chs_cf_key.append(cf_key)
+            else:
+                ar_key = read_array(file, np.uint8, block_count).tolist()
+                chs_ar_key.append(ar_key)
 
-            container_shape = None
             if pm_mode:
-                c_w = read_int(file)
-                c_h = read_int(file)
-                container_shape = c_w, c_h
+                pm_fix_key_len = read_int(file)
+                pm_fix_key = []
+                for i in range(pm_fix_key_len):
+                    fix_len = read_int(file)
+                    pm_fix_key.append(read_array(file, np.uint32, fix_len))
 
-            cf_grid_size = None
-            if cf_mode:
-                cf_grid_size = read_int(file)
-
-            wmdct_block_size = None
-            ch_scale = None
-            wmdct_scale = None
-            if wmdct_mode:
-                wmdct_scale = scale
-                wmdct_block_size = read_int(file)
-            else:
-                ch_scale = scale
-
-            chs_qt_key = []
-            chs_ar_key = []
-            chs_cf_key = []
-            chs_pm_fix_key = []
-
-            for ch in range(chs_count):
-                qt_key_bytes_size = read_int(file)
-                qt_key = read_bits(file, qt_key_bytes_size)
-                qt_key, block_count = parse_qt_key(qt_key.tolist())
-                chs_qt_key.append(qt_key)
-
-                if cf_mode:
-                    cf_key_flat = np.fromfile(file, cls.cf_key_type(cf_grid_size), block_count * CF_POINTS_COUNT)
-                    cf_key = [tuple(curve.astype(np.int)) for curve in np.split(cf_key_flat, block_count)]
-                    chs_cf_key.append(cf_key)
-                else:
-                    ar_key = np.fromfile(file, np.uint8, block_count).tolist()
-                    chs_ar_key.append(ar_key)
-
-                if pm_mode:
-                    pm_fix_key_len = read_int(file)
-                    pm_fix_key = []
-                    for i in range(pm_fix_key_len):
-                        fix_len = read_int(file)
-                        pm_fix_key.append(np.fromfile(file, np.uint32, fix_len))
-
-                    chs_pm_fix_key.append(pm_fix_key)
+                chs_pm_fix_key.append(pm_fix_key)
 
         return cls(chs_qt_key,
                    chs_pm_fix_key,
@@ -226,7 +262,9 @@ class Key:
                    cf_grid_size,
                    wmdct_mode,
                    wmdct_block_size,
-                   wmdct_scale)
+                   wmdct_scale,
+                   tile_size,
+                   tiles_shape)
 
 
 class Container:
@@ -239,6 +277,10 @@ class Container:
     def size(self):
         return len(self.chs_regions_dct[0].matrix)
 
+    @property
+    def area(self):
+        return self.chs_regions_dct[0].matrix.size
+
     @property
     def chs_dct_img(self):
         return [regions.matrix
@@ -253,14 +295,14 @@ class Container:
     def available_bpp(self):
         total_size = sum(regions.total_size
                          for regions in self.chs_regions_dct_embed)
-        bpp = (total_size * 8) / self.size ** 2
+        bpp = (total_size * 8) / self.area
         return bpp
 
     @property
     def fact_bpp(self):
         wm_w, wm_h = self.key.wm_shape
         ch_count = len(self.chs_regions_dct)
-        return (8 * ch_count * wm_w * wm_h) / self.size ** 2
+        return (8 * ch_count * wm_w * wm_h) / self.area
 
 
 def int_to_byte(int_):
@@ -281,7 +323,12 @@ def read_int(file):
 
 
 def read_bits(file, size):
-    return np.unpackbits(np.fromfile(file, np.uint8, size))
+    return np.unpackbits(read_array(file, np.uint8, size))
+
+
+def read_array(file, type_, count):
+    type_ = np.dtype(type_)
+    return np.frombuffer(bytearray(file.read(type_.itemsize * count)), type_)
 
 
 def size_of_chs(chs):
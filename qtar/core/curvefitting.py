@@ -1,18 +1,24 @@
 import math
-from itertools import islice, count
+from itertools import count
 
 import numpy as np
 from PIL import Image, ImageDraw
 
+from qtar.core.cache import ArraysCache
 from qtar.core.matrixregion import MatrixRegions, draw_borders
 from qtar.core.quantizationmatrix import generate_quantization_matrix
 
 
 class CFRegions(MatrixRegions):
+    """
+    Regions with their parts below curves, elements of every region are taken column by column.
+    Geometry of curves is found once for every shape of rect and curve and kept in cf_cache.
+    """
     def __init__(self, rects, matrix, curves, grid_size=8):
         super().__init__(rects, matrix)
         self.curves = curves
         self.grid_size = grid_size
+        self.sizes = None
 
     def __getitem__(self, i):
         mx_region = self.get_cfregion(self.rects[i], self.curves[i])
@@ -22,34 +28,18 @@ class CFRegions(MatrixRegions):
         self.set_cfregion(self.rects[i], self.curves[i], value)
 
     def get_cfregion_size(self, i):
-        rect = self.rects[i]
-        curve = self.curves[i]
-
-        x0, y0, x1, y1 = rect
-
-        height, width = y1 - y0, x1 - x0
-
-        normal_curve = [coord * self.grid_size for coord in curve]
-
-        size = 0
-        for x in range(width):
-            y = math.ceil(curve_func(normal_curve, x))
-            col_h = height - y
-            col_h = col_h if col_h >= 0 else 0
-            size += col_h
-
-        return size
+        x0, y0, x1, y1 = self.rects[i]
+        return cf_size((y1 - y0, x1 - x0), self.curves[i], self.grid_size)
 
     def get_cfregion_columns(self, rect, curve):
         rect_region = super().get_region(rect)
-        normal_curve = [coord * self.grid_size for coord in curve]
-        return [
-            column[math.ceil(curve_func(normal_curve, x)):]
-            for x, column in enumerate(rect_region.T)  # column wise
-        ]
+        tops = cf_tops(rect_region.shape[1], curve, self.grid_size)
+        return [column[top:] for top, column in zip(tops.tolist(), rect_region.T)]  # column wise
 
-    def get_cfregion(self, *args):
-        return np.concatenate(self.get_cfregion_columns(*args))
+    def get_cfregion(self, rect, curve):
+        region = self.get_region(rect)
+        positions = cf_positions(region.shape, curve, self.grid_size)
+        return region[positions[:, 0], positions[:, 1]]
 
     def columned_regions(self):
         for rect, curve in zip(self.rects, self.curves):
@@ -57,24 +47,14 @@ class CFRegions(MatrixRegions):
 
     def set_cfregion_columns(self, rect, curve, value):
         region = self.get_region(rect)
-        height, width = region.shape
-        normal_curve = [coord * self.grid_size for coord in curve]
-
-        for x in range(width):
-            y = math.ceil(curve_func(normal_curve, x))
-            region[y:, x] = value[x]
+        tops = cf_tops(region.shape[1], curve, self.grid_size)
+        for x, top in enumerate(tops.tolist()):
+            region[top:, x] = value[x]
 
     def set_cfregion(self, rect, curve, value):
         region = self.get_region(rect)
-        height, width = region.shape
-        val_iter = iter(value)
-        normal_curve = [coord * self.grid_size for coord in curve]
-
-        for x in range(width):
-            y = math.ceil(curve_func(normal_curve, x))
-            col_height = max(0, height - y)
-            col_value = np.array(list(islice(val_iter, col_height)))
-            region[y:, x] = col_value
+        positions = cf_positions(region.shape, curve, self.grid_size)
+        region[positions[:, 0], positions[:, 1]] = np.ravel(value)[:len(positions)]
 
     @classmethod
     def from_regions(cls, mregions, curves, cf_grid_size):
@@ -82,10 +62,58 @@ class CFRegions(MatrixRegions):
 
     @property
     def total_size(self):
-        total_size = 0
-        for i in range(len(self.curves)):
-            total_size += self.get_cfregion_size(i)
-        return total_size
+        return sum(self.cfregions_sizes())
+
+    def cfregions_sizes(self):
+        """Sizes of all regions, found once for rects and curves of the regions."""
+        if self.sizes is None:
+            self.sizes = [self.get_cfregion_size(i) for i in range(len(self.curves))]
+        return self.sizes
+
+
+# max total size of curve geometry of all shapes kept in memory
+CF_CACHE_SIZE = 32 * 1024 ** 2
+
+cf_cache = ArraysCache(CF_CACHE_SIZE)
+
+
+def cf_tops(width, curve, grid_size):
+    """Rows where columns of region of given width start below the curve, they may be below the region too."""
+    key = ('tops', width, tuple(curve), grid_size)
+    return cf_cache.get(key, lambda: build_cf_tops(width, [coord * grid_size for coord in curve]))
+
+
+def cf_mask(shape, curve, grid_size):
+    """Boolean matrix of elements of region of given shape (height, width) below the curve."""
+    shape = tuple(shape)
+    key = ('mask', shape, tuple(curve), grid_size)
+    return cf_cache.get(key, lambda: np.arange(shape[0])[:, None] >= cf_tops(shape[1], curve, grid_size)[None, :])
+
+
+def cf_positions(shape, curve, grid_size):
+    """Positions (y, x) of elements of region of given shape below the curve column by column, shape (size, 2)."""
+    shape = tuple(shape)
+    key = ('positions', shape, tuple(curve), grid_size)
+    return cf_cache.get(key, lambda: np.argwhere(cf_mask(shape, curve, grid_size).T)[:, ::-1].astype(np.int32))
+
+
+def cf_size(shape, curve, grid_size):
+    height, width = shape
+    if height <= 0 or width <= 0:
+        return 0
+    return int(np.maximum(height - cf_tops(width, curve, grid_size), 0).sum())
+
+
+def build_cf_tops(width, curve):
+    Ay, B, Cx = curve
+    x = np.arange(width, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if Cx == B:
+            right = np.zeros(width)
+        else:
+            right = ((B - x) / (Cx - B) + 1) * B
+        y = np.where(x < B, (x / B) * (B - Ay) + Ay, right)
+    return np.ceil(np.maximum(y, 0)).astype(np.int64)
 
 
 def aligned_curve_func(curve, x, grid_size=8):
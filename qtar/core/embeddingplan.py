@@ -0,0 +1,233 @@
+import hashlib
+
+import numpy as np
+
+from qtar.core.cache import ArraysCache
+from qtar.core.curvefitting import CFRegions, cf_positions
+from qtar.core.imageqt import QtKeyError
+from qtar.core.matrixregion import divide_into_equal_regions
+from qtar.core.zigzag import zigzag_positions, cf_reversed_zigzag_order, round_robin_order
+
+# orders of elements inside a region
+ROWS = 'rows'
+COLUMNS = 'columns'
+ZIGZAG = 'zigzag'
+REVERSED_ZIGZAG = 'reversed zigzag'
+
+# max total size in bytes of plans kept in memory by get_plan
+PLANS_CACHE_SIZE = 256 * 1024 ** 2
+
+plans_cache = ArraysCache(PLANS_CACHE_SIZE)
+
+
+class EmbeddingPlan:
+    """
+    Map of elements of secret image to DCT coefficients of container, one per channel.
+
+    chs_indexes[ch][i] is flat index of the coefficient of container holding element i of flattened secret channel
+    (pixels of secret image or its quantized DCT in wmdct mode), -1 if the element does not fit into container.
+    The order is the same as zigzag_embed_to_regions and friends give, but is found once for a key.
+    digest is plan_digest of the key and shape of channel matrices the plan is built for.
+    """
+    def __init__(self, chs_indexes, wm_shape, digest=None, matrix_shape=None):
+        self.chs_indexes = chs_indexes
+        self.wm_shape = tuple(wm_shape)
+        self.digest = digest
+        self.matrix_shape = tuple(matrix_shape) if matrix_shape is not None else None
+
+    @property
+    def secret_shape(self):
+        """Shape of secret channel matrix, wm_shape is size of secret image: width and height."""
+        width, height = self.wm_shape
+        return height, width
+
+    @classmethod
+    def build(cls, chs_regions, key):
+        """Builds plan for regions to embed into (adaptive or curve-fitting regions of every channel) and key."""
+        matrix_shape = chs_regions[0].matrix.shape
+        return cls([plan_channel(regions, key) for regions in chs_regions], key.wm_shape,
+                   plan_digest(key, matrix_shape), matrix_shape)
+
+    def embed(self, ch, matrix, secret):
+        indexes = self.chs_indexes[ch]
+        fits = indexes >= 0
+        matrix.flat[indexes[fits]] = np.ravel(secret)[fits]
+        return matrix
+
+    def extract(self, ch, matrix):
+        indexes = self.chs_indexes[ch]
+        fits = indexes >= 0
+        secret = np.zeros(indexes.size)
+        secret[fits] = matrix.flat[indexes[fits]]
+        return secret
+
+    @property
+    def nbytes(self):
+        return sum(indexes.nbytes for indexes in self.chs_indexes)
+
+    def setflags(self, write):
+        # cached plans are shared between embeddings, their indexes are read-only as arrays of ArraysCache are
+        for indexes in self.chs_indexes:
+            indexes.setflags(write=write)
+
+    def validate(self, key, matrix_shape=None):
+        """Raises QtKeyError if the plan is not built for key or for channel matrices of matrix_shape."""
+        wm_size = self.wm_shape[0] * self.wm_shape[1]
+        if self.wm_shape != tuple(key.wm_shape):
+            raise QtKeyError("Plan is built for secret image of size %s, key has %s" % (self.wm_shape,
+                                                                                        tuple(key.wm_shape)))
+        if len(self.chs_indexes) != len(key.chs_qt_key):
+            raise QtKeyError("Plan is built for %d channels, key has %d" % (len(self.chs_indexes),
+                                                                          len(key.chs_qt_key)))
+        matrix_size = matrix_shape[0] * matrix_shape[1] if matrix_shape is not None else None
+        for indexes in self.chs_indexes:
+            if indexes.size != wm_size or (matrix_size is not None and indexes.size and indexes.max() >= matrix_size):
+                raise QtKeyError("Plan does not match the key")
+
+        if self.digest is not None:
+            if matrix_shape is not None and tuple(matrix_shape) != self.matrix_shape:
+                raise QtKeyError("Plan is built for container of size %s, stego image has %s" %
+                                 (self.matrix_shape, tuple(matrix_shape)))
+            if plan_digest(key, self.matrix_shape) != self.digest:
+                raise QtKeyError("Plan is built for another key")
+
+    def fits(self, ch):
+        return bool((self.chs_indexes[ch] >= 0).all())
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            np.savez(file, wm_shape=np.array(self.wm_shape), digest=np.array(self.digest or ''),
+                     matrix_shape=np.array(self.matrix_shape or ()),
+                     **{'ch%d' % ch: indexes for ch, indexes in enumerate(self.chs_indexes)})
+
+    @classmethod
+    def open(cls, path, key=None):
+        """Opens saved plan, checks it against key if key is given."""
+        with np.load(path) as file:
+            chs_count = sum(name.startswith('ch') for name in file.files)
+            digest = str(file['digest']) if 'digest' in file.files else ''
+            matrix_shape = file['matrix_shape'].tolist() if 'matrix_shape' in file.files else []
+            plan = cls([file['ch%d' % ch] for ch in range(chs_count)], file['wm_shape'].tolist(),
+                       digest or None, matrix_shape or None)
+        if key is not None:
+            plan.validate(key)
+        return plan
+
+
+def get_plan(chs_regions, key):
+    """Plan for key from in-memory cache of recently used plans, built if there is none."""
+    digest = plan_digest(key, chs_regions[0].matrix.shape)
+    return plans_cache.get(digest, lambda: EmbeddingPlan.build(chs_regions, key))
+
+
+def plan_digest(key, matrix_shape):
+    """Hash of everything in key the plan depends on."""
+    sha = hashlib.sha1()
+    sha.update(repr((tuple(matrix_shape), tuple(key.wm_shape), key.cf_mode, key.cf_grid_size,
+                     key.wmdct_mode, key.wmdct_block_size, key.tile_size, key.tiles_shape)).encode())
+    for qt_key in key.chs_qt_key:
+        sha.update(np.packbits(np.asarray(qt_key, bool)).tobytes() + b'|')
+    for ar_key in key.chs_ar_key:
+        sha.update(np.asarray(ar_key, np.int64).tobytes() + b'|')
+    for cf_key in key.chs_cf_key:
+        sha.update(np.asarray(cf_key, np.int64).tobytes() + b'|')
+    return sha.hexdigest()
+
+
+def plan_channel(regions, key):
+    wm_size = key.wm_shape[0] * key.wm_shape[1]
+    index_type = np.int32 if regions.matrix.size <= np.iinfo(np.int32).max else np.int64
+    indexes = np.arange(regions.matrix.size, dtype=index_type).reshape(regions.matrix.shape)
+
+    if isinstance(regions, CFRegions):
+        slots, slots_regions, slots_ranks = cfregions_slots(regions, indexes,
+                                                            REVERSED_ZIGZAG if key.wmdct_mode else COLUMNS)
+    else:
+        slots, slots_regions, slots_ranks = regions_slots(regions, indexes,
+                                                          REVERSED_ZIGZAG if key.wmdct_mode else ROWS)
+
+    if key.wmdct_mode:
+        # secret coefficients are taken from blocks of the secret and put into regions in turns
+        wm_width, wm_height = key.wm_shape
+        wm_indexes = np.arange(wm_size, dtype=index_type).reshape((wm_height, wm_width))
+        wm_slots, wm_regions, wm_ranks = regions_slots(divide_into_equal_regions(wm_indexes, key.wmdct_block_size),
+                                                       wm_indexes, ZIGZAG)
+        secret_order = wm_slots[round_robin_order(wm_regions, wm_ranks, wm_size)]
+        slots = slots[round_robin_order(slots_regions, slots_ranks, wm_size)]
+    else:
+        secret_order = np.arange(wm_size)
+        slots = slots[sequential_order(slots_regions, slots_ranks, len(regions))[:wm_size]]
+
+    plan = np.full(wm_size, -1, index_type)
+    plan[secret_order[:slots.size]] = slots[:wm_size]
+    return plan
+
+
+def regions_slots(regions, indexes, order=ROWS):
+    """
+    Flat indexes of elements of all regions with index of region and rank of element inside region in given order.
+    """
+    height, width = regions.matrix.shape
+    rects = np.asarray(regions.rects, np.int64).reshape((-1, 4))
+    x0, y0 = np.minimum(rects[:, 0], width), np.minimum(rects[:, 1], height)
+    heights = np.maximum(np.minimum(rects[:, 3], height) - y0, 0)
+    widths = np.maximum(np.minimum(rects[:, 2], width) - x0, 0)
+
+    slots, slots_regions, slots_ranks = [], [], []
+    nonempty = np.flatnonzero(heights * widths)
+    shapes = np.stack((heights[nonempty], widths[nonempty]), axis=1)
+    if shapes.size == 0:
+        return empty_slots(indexes.dtype)
+    unique_shapes, class_ids = np.unique(shapes, axis=0, return_inverse=True)
+    class_ids = class_ids.ravel()
+    for class_id, (h, w) in enumerate(unique_shapes.tolist()):
+        ids = nonempty[class_ids == class_id]
+        rows = y0[ids, None, None] + np.arange(h)[None, :, None]
+        cols = x0[ids, None, None] + np.arange(w)[None, None, :]
+        class_slots = indexes[rows, cols].reshape((ids.size, h * w))
+        if order == ZIGZAG:
+            class_slots = class_slots[:, zigzag_positions((h, w))]
+        elif order == REVERSED_ZIGZAG:
+            class_slots = class_slots[:, zigzag_positions((h, w))[::-1]]
+        slots.append(class_slots.ravel())
+        slots_regions.append(np.repeat(ids, h * w))
+        slots_ranks.append(np.tile(np.arange(h * w), ids.size))
+
+    return np.concatenate(slots), np.concatenate(slots_regions), np.concatenate(slots_ranks)
+
+
+def cfregions_slots(regions, indexes, order=COLUMNS):
+    """
+    The same as regions_slots for curve-fitting regions,
+    in reversed zigzag order elements of the whole rect above the curve are skipped.
+    """
+    slots, slots_regions, slots_ranks = [], [], []
+    for i, (rect, curve) in enumerate(zip(regions.rects, regions.curves)):
+        x0, y0, x1, y1 = rect
+        rect_indexes = indexes[y0:y1, x0:x1]
+        if order == REVERSED_ZIGZAG:
+            positions = cf_reversed_zigzag_order(rect_indexes.shape, curve, regions.grid_size)
+        else:
+            positions = cf_positions(rect_indexes.shape, curve, regions.grid_size)
+        if positions.size == 0:
+            continue
+        slots.append(rect_indexes[positions[:, 0], positions[:, 1]])
+        slots_regions.append(np.full(len(positions), i))
+        slots_ranks.append(np.arange(len(positions)))
+
+    if not slots:
+        return empty_slots(indexes.dtype)
+    return np.concatenate(slots), np.concatenate(slots_regions), np.concatenate(slots_ranks)
+
+
+def empty_slots(index_type):
+    return np.zeros(0, index_type), np.zeros(0, np.int64), np.zeros(0, np.int64)
+
+
+def sequential_order(slots_regions, slots_ranks, regions_count):
+    """Order of slots taken region after region."""
+    regions_sizes = np.bincount(slots_regions, minlength=regions_count)
+    positions = (np.cumsum(regions_sizes) - regions_sizes)[slots_regions] + slots_ranks
+    order = np.empty(positions.size, np.int64)
+    order[positions] = np.arange(positions.size)
+    return order
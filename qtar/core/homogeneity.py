@@ -0,0 +1,77 @@
+import numpy as np
+
+RANGE = 'range'
+STD = 'std'
+VARIANCE = 'variance'
+
+CRITERIA = (RANGE, STD, VARIANCE)
+
+# thresholds are given as a share of the widest possible spread of 8-bit values
+RANGE_SCALE = 256
+STD_SCALE = 128
+VARIANCE_SCALE = 128 ** 2
+
+
+class IntegralImage:
+    """
+    Summed-area tables of matrix values and their squares.
+    Sum, mean and variance of any rect are found from four corners of the tables.
+    """
+    def __init__(self, matrix):
+        sum_type = sum_type_of(matrix)
+        height, width = matrix.shape
+        values = matrix.astype(sum_type)
+        self.sat = np.zeros((height + 1, width + 1), sum_type)
+        self.sq_sat = np.zeros((height + 1, width + 1), sum_type)
+        np.cumsum(np.cumsum(values, axis=0), axis=1, out=self.sat[1:, 1:])
+        np.cumsum(np.cumsum(values * values, axis=0), axis=1, out=self.sq_sat[1:, 1:])
+
+    def rect_sums(self, rect):
+        x0, y0, x1, y1 = rect
+        return (self.sat[y1, x1] - self.sat[y0, x1] - self.sat[y1, x0] + self.sat[y0, x0],
+                self.sq_sat[y1, x1] - self.sq_sat[y0, x1] - self.sq_sat[y1, x0] + self.sq_sat[y0, x0])
+
+    def blocks_sums(self, size):
+        """Sums of values and squares of every block of equal size tiling the matrix."""
+        return _corners_diff(self.sat[::size, ::size]), _corners_diff(self.sq_sat[::size, ::size])
+
+
+def homogeneous(threshold, criterion, count, sums, sq_sums=None, max_mx=None, min_mx=None):
+    """
+    Checks if blocks are homogeneous by given criterion.
+    Brightness of blocks chooses one of the thresholds if a sequence of thresholds is given.
+    """
+    brightness = sums / count
+    thresholds = _thresholds_mx(brightness, threshold)
+
+    if criterion == RANGE:
+        return max_mx - min_mx < thresholds * RANGE_SCALE
+
+    variance = np.maximum((sq_sums - sums * brightness) / count, 0)
+    if criterion == STD:
+        return np.sqrt(variance) < thresholds * STD_SCALE
+    elif criterion == VARIANCE:
+        return variance < thresholds * VARIANCE_SCALE
+
+    raise WrongCriterionError("Unknown homogeneity criterion: %s" % criterion)
+
+
+def sum_type_of(matrix):
+    return np.int64 if np.issubdtype(matrix.dtype, np.integer) else np.float64
+
+
+def _thresholds_mx(brightness, threshold):
+    if isinstance(threshold, (float, int)):
+        return threshold
+    bright_types_count = len(threshold)
+    bright_types_max = [int(255 / bright_types_count * (i + 1)) for i in range(0, bright_types_count - 1)]
+    bright_types = np.searchsorted(bright_types_max, brightness, side='left')
+    return np.asarray(threshold)[bright_types]
+
+
+def _corners_diff(sat):
+    return sat[1:, 1:] - sat[:-1, 1:] - sat[1:, :-1] + sat[:-1, :-1]
+
+
+class WrongCriterionError(Exception):
+    pass
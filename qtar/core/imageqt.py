@@ -1,8 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
-from math import sqrt
 
 import numpy as np
 
+from qtar.core.homogeneity import IntegralImage, RANGE, homogeneous, sum_type_of
 from qtar.core.matrixregion import MatrixRegions
 from qtar.core.permutation import permutate
 
@@ -44,36 +45,120 @@ class QtNode:
         return self.children
 
 
+class QtTree:
+    """
+    Quad tree stored as columns of int32 arrays, one row per node in depth-first order.
+    Parent of the root is -1.
+    """
+    def __init__(self, x0, y0, size, depth, parent, is_leaf):
+        self.x0 = np.asarray(x0, np.int32)
+        self.y0 = np.asarray(y0, np.int32)
+        self.size = np.asarray(size, np.int32)
+        self.depth = np.asarray(depth, np.int32)
+        self.parent = np.asarray(parent, np.int32)
+        self.is_leaf = np.asarray(is_leaf, bool)
+        self.node_objects = None
+        self.leaf_objects = None
+
+    @classmethod
+    def from_preorder(cls, xs, ys, sizes, depths, split):
+        return cls(xs, ys, sizes, depths, preorder_parents(depths), ~np.asarray(split, bool))
+
+    @classmethod
+    def from_key(cls, key, size):
+        return cls.from_preorder(*decode_qt_key(key, size))
+
+    def __len__(self):
+        return self.size.size
+
+    @property
+    def key(self):
+        return (~self.is_leaf).tolist()
+
+    @property
+    def rects(self):
+        return self.get_rects(self.is_leaf)
+
+    @property
+    def branch_rects(self):
+        return self.get_rects(~self.is_leaf)
+
+    def get_rects(self, mask):
+        x0, y0, size = self.x0[mask], self.y0[mask], self.size[mask]
+        return list(zip(x0.tolist(), y0.tolist(), (x0 + size).tolist(), (y0 + size).tolist()))
+
+    @property
+    def max_depth(self):
+        return int(self.depth[self.is_leaf].max()) if len(self) else 0
+
+    @property
+    def max_leaf_size(self):
+        return int(self.size[self.is_leaf].max()) if len(self) else 0
+
+    def nodes(self):
+        """QtNode objects of the tree in depth-first order, built once on the first call."""
+        if self.node_objects is None:
+            self.node_objects = self.build_nodes()
+        return self.node_objects
+
+    def leaves(self):
+        if self.leaf_objects is None:
+            self.leaf_objects = [node for node, is_leaf in zip(self.nodes(), self.is_leaf.tolist()) if is_leaf]
+        return self.leaf_objects
+
+    def build_nodes(self):
+        nodes = []
+        for x0, y0, size, parent in zip(self.x0.tolist(), self.y0.tolist(), self.size.tolist(), self.parent.tolist()):
+            parent = nodes[parent] if parent >= 0 else None
+            node = QtNode(parent, (x0, y0, x0 + size, y0 + size))
+            if parent is not None:
+                px0, py0, _, _ = parent.rect
+                parent.type = QtNode.BRANCH
+                parent.children[(y0 - py0) // size * 2 + (x0 - px0) // size] = node
+            nodes.append(node)
+        return nodes
+
+
 class ImageQT(MatrixRegions):
-    def __init__(self, matrix, min_size=None, max_size=None, threshold=None, key=None):
+    def __init__(self, matrix, min_size=None, max_size=None, threshold=None, key=None, criterion=RANGE):
         super().__init__([], matrix)
         self.threshold = threshold
+        self.criterion = criterion
+        self.integral = None
         self.min_size = min_size
         self.max_size = max_size
-        self.max_depth = 0
         self.key = key
-        self.all_nodes = []
-        self.leaves = []
+        self.tree = None
 
         if key is None:
-            self.key = []
-            self.build_tree(QtNode(None, (0, 0, matrix.shape[1], matrix.shape[0])))
+            if self.pyramid_supported():
+                self.build_tree_pyramid()
+            else:
+                self.key = []
+                self.build_tree(QtNode(None, (0, 0, matrix.shape[1], matrix.shape[0])))
+                self.tree = QtTree.from_key(self.key, matrix.shape[1])
+            self.key = self.tree.key
         else:
+            self.build_tree_from_key(key)
             self.min_size = 0
-            self.max_size = 0
-            self.build_tree_from_key(QtNode(None, (0, 0, matrix.shape[1], matrix.shape[0])), copy(key))
-        self.rects = [leave.rect for leave in self.leaves]
+            self.max_size = self.tree.max_leaf_size
+        self.max_depth = self.tree.max_depth
+        self.rects = self.tree.rects
+
+    @property
+    def all_nodes(self):
+        return self.tree.nodes()
+
+    @property
+    def leaves(self):
+        return self.tree.leaves()
 
     def build_tree(self, node):
         too_big = node.size > self.max_size
         too_small = node.size <= self.min_size
-        self.all_nodes.append(node)
 
         if (not too_big and self.spans_homogeneity(node.rect)) or too_small:
-            if node.depth > self.max_depth:
-                self.max_depth = node.depth
             self.key.append(False)
-            self.leaves.append(node)
             return
 
         self.key.append(True)
@@ -81,66 +166,92 @@ class ImageQT(MatrixRegions):
         for child in children:
             self.build_tree(child)
 
-    def build_tree_from_key(self, node, key):
-        subivide = key.pop(0)
-        self.all_nodes.append(node)
-        if subivide:
-            children = node.subdivide()
-            for child in children:
-                self.build_tree_from_key(child, key)
-        else:
-            if node.depth > self.max_depth:
-                self.max_depth = node.depth
-            if node.size > self.max_size:
-                self.max_size = node.size
-            if node.size < self.min_size:
-                self.min_size = node.size
-            self.leaves.append(node)
+    def pyramid_supported(self):
+        height, width = self.matrix.shape
+        if height != width or not self.min_size or self.min_size < 1:
+            return False
+        depth = pyramid_depth(width, self.min_size)
+        return width % (1 << depth) == 0
+
+    def build_tree_pyramid(self):
+        self.tree = QtTree.from_preorder(*build_qt_pyramid(self.matrix, self.min_size, self.max_size,
+                                                           self.threshold, self.criterion))
+
+    def build_tree_from_key(self, key):
+        self.tree = QtTree.from_key(key, self.matrix.shape[1])
 
     def spans_homogeneity(self, rect):
         region = self.get_region(rect)
-        max_value = np.amax(region)
-        min_value = np.amin(region)
-        homogeneity = max_value - min_value
-        if isinstance(self.threshold, (float, int)):
-            return homogeneity < self.threshold * 256
-        else:
-            brightness = np.average(region)
-            bright_types_count = len(self.threshold)
-            for i in range(0, bright_types_count-1):
-                bright_type_max = int(255 / bright_types_count * (i + 1))
-                if brightness <= bright_type_max:
-                    return homogeneity < self.threshold[i] * 256
-            return homogeneity < self.threshold[-1] * 256
+        sums, sq_sums = self.rect_sums(rect)
+        if self.criterion == RANGE:
+            return homogeneous(self.threshold, self.criterion, region.size, sums,
+                               max_mx=np.amax(region), min_mx=np.amin(region))
+        return homogeneous(self.threshold, self.criterion, region.size, sums, sq_sums)
+
+    def rect_sums(self, rect):
+        if self.integral is None:
+            self.integral = IntegralImage(self.matrix)
+        return self.integral.rect_sums(rect)
 
 
 class ImageQTPM(ImageQT):
-    def __init__(self, matrix, min_size=None, max_size=None, threshold=None, key=None, permutation=None):
+    def __init__(self, matrix, min_size=None, max_size=None, threshold=None, key=None, permutation=None,
+                 criterion=RANGE):
         self.has_permutation = permutation is not None
         if not self.has_permutation:
-            self.permutation = np.arange(matrix.size).reshape(matrix.shape)
+            index_type = np.int32 if matrix.size <= np.iinfo(np.int32).max else np.int64
+            self.permutation = np.arange(matrix.size, dtype=index_type).reshape(matrix.shape)
         else:
             self.permutation = permutation
 
         self.original_mx = copy(matrix)
 
-        super().__init__(matrix, min_size, max_size, threshold, key)
+        super().__init__(matrix, min_size, max_size, threshold, key, criterion)
 
         if key and self.has_permutation:
             self.matrix = permutate(self.matrix, permutation)
 
-        self.rects = [leave.rect for leave in self.leaves]
+    def build_tree_pyramid(self):
+        # alignment changes the matrix while the tree grows, so block statistics are taken level by level
+        n = self.matrix.shape[0]
+        leaves_depth = pyramid_depth(n, self.min_size)
+        sum_type = sum_type_of(self.matrix)
+
+        levels_split = []
+        exists = np.ones((1, 1), bool)
+        for depth in range(leaves_depth + 1):
+            size = n >> depth
+            split = np.zeros(exists.shape, bool)
+            iy, ix = np.nonzero(exists)
+
+            if depth < leaves_depth and iy.size:
+                if size > self.max_size:
+                    nodes_split = np.ones(iy.size, bool)
+                else:
+                    blocks = self.matrix[_blocks_index(ix * size, iy * size, size)].astype(sum_type)
+                    sums = blocks.sum(axis=(1, 2))
+                    if self.criterion == RANGE:
+                        nodes_split = ~homogeneous(self.threshold, self.criterion, size * size, sums,
+                                                   max_mx=blocks.max(axis=(1, 2)), min_mx=blocks.min(axis=(1, 2)))
+                    else:
+                        nodes_split = ~homogeneous(self.threshold, self.criterion, size * size, sums,
+                                                   (blocks * blocks).sum(axis=(1, 2)))
+                iy, ix = iy[nodes_split], ix[nodes_split]
+                split[iy, ix] = True
+                self.align_blocks(ix * size, iy * size, size)
+
+            levels_split.append(split)
+            if depth < leaves_depth:
+                exists = split.repeat(2, axis=0).repeat(2, axis=1)
+
+        self.tree = QtTree.from_preorder(*preorder_from_levels(levels_split, n))
 
     def build_tree(self, node):
         too_big = node.size > self.max_size
         too_small = node.size <= self.min_size
-        self.all_nodes.append(node)
 
         if (not too_big and self.spans_homogeneity(node.rect)) or too_small:
-            if node.depth > self.max_depth:
-                self.max_depth = node.depth
             self.key.append(False)
-            self.leaves.append(node)
             return
 
         self.align(node.rect)
@@ -149,62 +260,273 @@ class ImageQTPM(ImageQT):
         for child in children:
             self.build_tree(child)
 
-    def build_tree_from_key(self, node, key):
-        to_permutate = not self.has_permutation
-        subivide = key.pop(0)
-        self.all_nodes.append(node)
-        if subivide:
-            if to_permutate:
-                self.align(node.rect)
-            children = node.subdivide()
-            for child in children:
-                self.build_tree_from_key(child, key)
-        else:
-            if node.depth > self.max_depth:
-                self.max_depth = node.depth
-            if node.size > self.max_size:
-                self.max_size = node.size
-            if node.size < self.min_size:
-                self.min_size = node.size
-            self.leaves.append(node)
+    def build_tree_from_key(self, key):
+        super().build_tree_from_key(key)
+        if not self.has_permutation:
+            tree = self.tree
+            for depth in range(tree.max_depth):
+                branches = ~tree.is_leaf & (tree.depth == depth)
+                if branches.any():
+                    self.align_blocks(tree.x0[branches], tree.y0[branches], int(tree.size[branches][0]))
 
     def align(self, rect):
-        perm_regions = MatrixRegions([], self.permutation)
-        perm_region = perm_regions.get_region(rect)
-        region = self.get_region(rect)
-        regions_flat = region.flat
-        perm_region_flat_sorted = sorted(perm_region.flat, key=lambda k: self.original_mx.flat[k])
-        size = len(regions_flat)
-        subregion_size = int(size / 4)
-        perm_subregions = []
-
-        for i in range(4):
-            first = subregion_size * i
-            last = first + subregion_size
-            flat_subregion_perm = np.array(sorted(perm_region_flat_sorted[first:last]))
-            subregion_shape = int(sqrt(subregion_size))
-            subregion_perm = flat_subregion_perm.reshape((subregion_shape, subregion_shape))
-            perm_subregions.append(subregion_perm)
-
-        top = np.concatenate((perm_subregions[0], perm_subregions[1]), axis=1)
-        bottom = np.concatenate((perm_subregions[2], perm_subregions[3]), axis=1)
-        perm_region = np.concatenate((top, bottom), axis=0)
-        perm_regions.set_region(rect, perm_region)
-
-        region_flat = [self.original_mx.flat[p] for p in perm_region]
-        region = np.array(region_flat).reshape(perm_region.shape)
-        self.set_region(rect, region)
-
-
-def parse_qt_key(key, block_count=1, result_key=None):
-    if result_key is None:
-        result_key = []
-
-    subdivide = bool(key.pop(0))
-    result_key.append(subdivide)
-    if subdivide:
-        block_count = block_count - 1
-        for i in range(4):
-            result_key, block_count = parse_qt_key(key, block_count + 1, result_key)
-
-    return result_key, block_count
+        x0, y0, x1, y1 = rect
+        self.align_blocks(np.array([x0]), np.array([y0]), x1 - x0)
+
+    def align_blocks(self, x0, y0, size):
+        """
+        Sorts pixels of every given block by brightness and puts them into block quarters:
+        the darkest quarter goes to the top left one, the brightest - to the bottom right one.
+        Pixels inside a quarter keep the order of their original positions.
+        """
+        if x0.size == 0:
+            return
+        count = x0.size
+        h = size // 2
+        index = _blocks_index(x0, y0, size)
+
+        perm_flat = self.permutation[index].reshape((count, size * size))
+        order = np.argsort(np.take(self.original_mx, perm_flat), axis=1, kind='stable')
+        quarters = np.sort(np.take_along_axis(perm_flat, order, axis=1).reshape((count, 4, h * h)), axis=2)
+        perm_blocks = quarters.reshape((count, 2, 2, h, h)).transpose((0, 1, 3, 2, 4)).reshape((count, size, size))
+
+        self.permutation[index] = perm_blocks
+        self.matrix[index] = np.take(self.original_mx, perm_blocks)
+
+    def rect_sums(self, rect):
+        # alignment changes the matrix while the tree grows, so integral image can't be used
+        region = self.get_region(rect).astype(sum_type_of(self.matrix))
+        return region.sum(), (region * region).sum()
+
+
+class ImageQTForest(MatrixRegions):
+    """
+    Forest of quad trees built independently over square tiles of the matrix.
+    Tiles go in raster order, pixels out of whole tiles are not covered by any tree.
+    Key of the forest is keys of its trees written one after another.
+    """
+    def __init__(self, matrix, tile_size, min_size=None, max_size=None, threshold=None, key=None,
+                 criterion=RANGE, pm_mode=False, permutation=None, tiles_shape=None, workers=None):
+        super().__init__([], matrix)
+        height, width = matrix.shape
+        self.tile_size = tile_size
+        self.tiles_shape = tiles_shape or (width // tile_size, height // tile_size)
+        self.has_permutation = permutation is not None
+        cols, rows = self.tiles_shape
+        origins = [(x * tile_size, y * tile_size) for y in range(rows) for x in range(cols)]
+
+        if key is None:
+            tiles_keys = [None] * len(origins)
+        else:
+            ends = qt_key_ends(key, len(origins))
+            tiles_keys = [list(key[start:end]) for start, end in zip([0] + ends[:-1], ends)]
+
+        def build_tile(origin, tile_key):
+            x, y = origin
+            tile = matrix[y:y + tile_size, x:x + tile_size]
+            if pm_mode and not self.has_permutation:
+                return ImageQTPM(tile, min_size, max_size, threshold, tile_key, criterion=criterion)
+            return ImageQT(tile, min_size, max_size, threshold, tile_key, criterion=criterion)
+
+        if workers:
+            with ThreadPoolExecutor(workers) as executor:
+                self.trees = list(executor.map(build_tile, origins, tiles_keys))
+        else:
+            self.trees = list(map(build_tile, origins, tiles_keys))
+
+        self.key = [subdivide for tree in self.trees for subdivide in tree.key]
+        self.rects = [(x0 + x, y0 + y, x1 + x, y1 + y)
+                      for (x, y), tree in zip(origins, self.trees)
+                      for x0, y0, x1, y1 in tree.rects]
+
+        if pm_mode:
+            if self.has_permutation:
+                self.permutation = permutation
+                self.matrix = permutate(matrix, permutation)
+            else:
+                self.permutation = self.merge_permutations(origins)
+
+    @property
+    def tiled_shape(self):
+        cols, rows = self.tiles_shape
+        return rows * self.tile_size, cols * self.tile_size
+
+    def merge_permutations(self, origins):
+        height, width = self.matrix.shape
+        index_type = np.int32 if self.matrix.size <= np.iinfo(np.int32).max else np.int64
+        permutation = np.arange(self.matrix.size, dtype=index_type).reshape((height, width))
+        for (x, y), tree in zip(origins, self.trees):
+            local = tree.permutation.astype(index_type)
+            permutation[y:y + self.tile_size, x:x + self.tile_size] = \
+                (y + local // self.tile_size) * width + x + local % self.tile_size
+        return permutation
+
+
+def parse_qt_key(key, trees_count=1):
+    """
+    Cuts key of a quad tree (or keys of a forest of trees written one after another) off the trailing padding bits.
+
+    Returns key as a list and count of leaves (blocks).
+    """
+    key = np.asarray(key, bool)
+    key = key[:qt_key_ends(key, trees_count)[-1]] if trees_count else key[:0]
+    return key.tolist(), int(key.size - np.count_nonzero(key))
+
+
+def qt_key_ends(key, trees_count=1):
+    """
+    Finds where keys of quad trees written one after another end.
+    Every subdivided node adds 4 more nodes to read and every node is read once,
+    so the k-th tree ends right where the count of read nodes drops below -k for the first time,
+    i.e. where it reaches a new minimum.
+    """
+    nodes_read = np.cumsum(np.where(np.asarray(key, bool), 3, -1))
+    prev_min = np.minimum.accumulate(np.concatenate(([0], nodes_read[:-1])))
+    ends = np.flatnonzero(nodes_read < prev_min)[:trees_count] + 1
+    if ends.size < trees_count:
+        raise QtKeyError("Quad tree key is incomplete")
+    return ends.tolist()
+
+
+def decode_qt_key(key, size):
+    """
+    Restores geometry of quad tree from its key using explicit stack instead of recursion.
+
+    Returns nodes in the same order as build_qt_pyramid does:
+    x0, y0, size, depth and split flag of every node.
+    """
+    split = np.asarray(parse_qt_key(key)[0], bool)
+    count = split.size
+    xs = np.empty(count, np.int64)
+    ys = np.empty(count, np.int64)
+    sizes = np.empty(count, np.int64)
+    depths = np.empty(count, np.int64)
+
+    stack = [(0, 0, size, 0)]
+    for cursor, subdivide in enumerate(split.tolist()):
+        x0, y0, size, depth = stack.pop()
+        xs[cursor], ys[cursor], sizes[cursor], depths[cursor] = x0, y0, size, depth
+        if subdivide:
+            h = size // 2
+            depth += 1
+            stack.extend(((x0 + h, y0 + h, h, depth), (x0, y0 + h, h, depth),
+                          (x0 + h, y0, h, depth), (x0, y0, h, depth)))
+
+    return xs, ys, sizes, depths, split
+
+
+def preorder_parents(depths):
+    depths = np.asarray(depths)
+    parents = np.full(depths.size, -1, np.int32)
+    nodes = np.arange(depths.size)
+    for depth in range(1, int(depths.max(initial=0)) + 1):
+        uppers = nodes[depths == depth - 1]
+        lowers = nodes[depths == depth]
+        parents[lowers] = uppers[np.searchsorted(uppers, lowers) - 1]
+    return parents
+
+
+def pyramid_depth(size, min_size):
+    depth = 0
+    while size >> depth > min_size:
+        depth += 1
+    return depth
+
+
+def build_qt_pyramid(matrix, min_size, max_size, threshold, criterion=RANGE):
+    """
+    Builds quad tree of a square matrix level by level. Block max, min and sum are reduced once
+    for the deepest level that needs them and then merged 2x2 into the upper levels,
+    so every pixel is read only once. Spread criteria other than range take block sums
+    from integral image instead.
+
+    Returns nodes in the same order as recursive ImageQT.build_tree visits them:
+    x0, y0, size, depth and split flag of every node.
+    """
+    n = matrix.shape[0]
+    leaves_depth = pyramid_depth(n, min_size)
+
+    levels_split = [np.zeros((1 << leaves_depth, 1 << leaves_depth), bool)]
+    if leaves_depth > 0:
+        if criterion == RANGE:
+            size = n >> (leaves_depth - 1)
+            count = n // size
+            blocks = matrix.reshape((count, size, count, size))
+            max_mx = blocks.max(axis=(1, 3))
+            min_mx = blocks.min(axis=(1, 3))
+            sum_mx = blocks.sum(axis=(1, 3), dtype=sum_type_of(matrix))
+        else:
+            integral = IntegralImage(matrix)
+
+        for depth in range(leaves_depth - 1, -1, -1):
+            size = n >> depth
+            if size > max_size:
+                split = np.ones((1 << depth, 1 << depth), bool)
+            elif criterion == RANGE:
+                split = ~homogeneous(threshold, criterion, size * size, sum_mx, max_mx=max_mx, min_mx=min_mx)
+            else:
+                split = ~homogeneous(threshold, criterion, size * size, *integral.blocks_sums(size))
+            levels_split.insert(0, split)
+
+            if depth > 0 and criterion == RANGE:
+                count = max_mx.shape[0] // 2
+                max_mx = max_mx.reshape((count, 2, count, 2)).max(axis=(1, 3))
+                min_mx = min_mx.reshape((count, 2, count, 2)).min(axis=(1, 3))
+                sum_mx = sum_mx.reshape((count, 2, count, 2)).sum(axis=(1, 3))
+
+    return preorder_from_levels(levels_split, n)
+
+
+def preorder_from_levels(levels_split, n):
+    """
+    Orders nodes given by split flags of every tree level the same way as recursive ImageQT.build_tree visits them:
+    by Morton code of the node origin and then by depth, so every parent goes right before its subtree.
+
+    Returns x0, y0, size, depth and split flag of every node.
+    """
+    leaves_depth = len(levels_split) - 1
+    xs, ys, depths, splits, codes = [], [], [], [], []
+    exists = np.ones((1, 1), bool)
+    for depth, split in enumerate(levels_split):
+        iy, ix = np.nonzero(exists)
+        shift = leaves_depth - depth
+        xs.append(ix)
+        ys.append(iy)
+        depths.append(np.full(ix.size, depth))
+        splits.append(split[iy, ix])
+        codes.append(_morton_code(ix << shift, iy << shift))
+        if depth < leaves_depth:
+            exists = (exists & split).repeat(2, axis=0).repeat(2, axis=1)
+
+    depths = np.concatenate(depths)
+    order = np.lexsort((depths, np.concatenate(codes)))
+    depths = depths[order]
+    sizes = n >> depths
+    xs = np.concatenate(xs)[order] * sizes
+    ys = np.concatenate(ys)[order] * sizes
+    return xs, ys, sizes, depths, np.concatenate(splits)[order]
+
+
+def _blocks_index(x0, y0, size):
+    offsets = np.arange(size)
+    rows = (y0[:, None] + offsets)[:, :, None]
+    cols = (x0[:, None] + offsets)[:, None, :]
+    return rows, cols
+
+
+def _morton_code(x, y):
+    return _spread_bits(x) | (_spread_bits(y) << 1)
+
+
+def _spread_bits(v):
+    v = v.astype(np.int64)
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+class QtKeyError(Exception):
+    pass
@@ -63,6 +63,22 @@ def divide_into_equal_regions(matrix, region_size):
     return MatrixRegions(rects, matrix)
 
 
+def changed_rects(rects, matrix, changed_matrix):
+    """Marks rects with any value differing between two matrices."""
+    height, width = matrix.shape
+    diff_sat = np.zeros((height + 1, width + 1), np.int64)
+    np.cumsum(np.cumsum(matrix != changed_matrix, axis=0), axis=1, out=diff_sat[1:, 1:])
+    rects = np.asarray(rects, np.int64).reshape((-1, 4))
+    x0, y0 = np.minimum(rects[:, 0], width), np.minimum(rects[:, 1], height)
+    x1, y1 = np.minimum(rects[:, 2], width), np.minimum(rects[:, 3], height)
+    return (diff_sat[y1, x1] - diff_sat[y0, x1] - diff_sat[y1, x0] + diff_sat[y0, x0]) > 0
+
+
+def rects_sizes(rects):
+    rects = np.asarray(rects, np.int64).reshape((-1, 4))
+    return (np.maximum(rects[:, 2] - rects[:, 0], 0) * np.maximum(rects[:, 3] - rects[:, 1], 0)).tolist()
+
+
 def rect_size(rect):
     x0, y0, x1, y1 = rect
     return (x1 - x0) * (y1 - y0)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import math
+from copy import copy
+
+from qtar.core.qtar import DEFAULT_PARAMS
+from qtar.core.homogeneity import CRITERIA
+
+QTAR_ARGS = tuple(DEFAULT_PARAMS) + ('workers',)
+
+
+def get_qtar_params(params):
+    """Arguments of QtarStego from params of a command."""
+    return {name: params[name] for name in QTAR_ARGS if name in params}
+
+
+def validate_params(given_params):
+    params = copy(DEFAULT_PARAMS)
+    params.update(given_params)
+
+    th = params['homogeneity_threshold']
+    hc = params['homogeneity_criterion']
+    min_b = params['min_block_size']
+    max_b = params['max_block_size']
+    tile = params['tile_size']
+    q = params['quant_power']
+    s = params['ch_scale']
+    cf_g = params['cf_grid_size']
+    wmdct_b = params['wmdct_block_size']
+    wmdct_s = params['wmdct_scale']
+
+    if isinstance(th, (tuple, list)) and not all(0 <= t <= 1 for t in th) \
+            or isinstance(th, (float, int)) and not 0 <= th <= 1:
+        raise WrongQTARParamError('Wrong argument: threshold (th) must be real in range 0 <= th <= 1.')
+
+    if hc not in CRITERIA:
+        raise WrongQTARParamError('Wrong argument: homogeneity criterion (hc) must be one of: '
+                                  + ', '.join(CRITERIA) + '.')
+
+    if not (8 <= min_b <= max_b and is_power_of(min_b, 2)):
+        raise WrongQTARParamError('Wrong argument: min block size (min_b) must be integer in range '
+                                  '8 <= min_b <= max_b and power of 2.')
+
+    if not (min_b <= max_b and is_power_of(max_b, 2)):
+        raise WrongQTARParamError('Wrong argument: max block size (max_b) must be integer in range '
+                                  'min_b <= max_b <= container_size and power of 2.')
+
+    if tile is not None and not (min_b <= tile and is_power_of(tile, 2)):
+        raise WrongQTARParamError('Wrong argument: tile size (tile) must be integer in range '
+                                  'min_b <= tile and power of 2.')
+
+    if not 0 < q <= 1:
+        raise WrongQTARParamError('Wrong argument: quantization power (q) must be real in range 0 < q <= 1.')
+
+    if not 0 < s <= 20:
+        raise WrongQTARParamError('Wrong argument: scale factor (k) must be real in range 0 < k <= 20.')
+
+    if not 1 <= cf_g <= min_b:
+        raise WrongQTARParamError('Wrong argument: curve-fitting grid (cf) must be integer in range 1 <= cf <= min_b.')
+
+    if not 1 <= wmdct_b:
+        raise WrongQTARParamError('Wrong argument: secret image DCT block size (v) must be integer in range '
+                                  '1 <= v <= secret-image size.')
+
+    if not 0 < wmdct_s <= 1:
+        raise WrongQTARParamError('Wrong argument: scale factor for secret image DCT coefficients (sk) '
+                                  'must be real in range 0 < sk <= 1.')
+
+    return params
+
+
+def is_power_of(value, base):
+    power = int(math.log(value, base))
+    return value == base**power
+
+
+class WrongQTARParamError(Exception):
+    pass
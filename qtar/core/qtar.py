@@ -1,20 +1,25 @@
 import warnings
-from itertools import islice
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from math import log2, pow, sqrt
 from copy import copy
 
 from PIL import Image, ImageChops
-from numpy import array, zeros, append
-from scipy.fftpack import dct, idct
+from numpy import array, zeros
 
-from qtar.core.imageqt import ImageQT, ImageQTPM
+from qtar.core.imageqt import ImageQT, ImageQTPM, ImageQTForest
+from qtar.core.homogeneity import RANGE
 from qtar.core.curvefitting import fit_cfregions, CFRegions, draw_cf_map
 from qtar.core.quantizationmatrix import generate_flat_matrix
 from qtar.core.adaptiveregions import adapt_regions
-from qtar.core.permutation import reverse_permutation, fix_diff, get_diff_fix
+from qtar.core.permutation import permutate, reverse_permutation, fix_diff, get_diff_fix
 from qtar.core.container import Container, Key
-from qtar.core.matrixregion import MatrixRegions, divide_into_equal_regions, draw_borders_on
-from qtar.core.zigzag import zigzag_embed_to_regions, zigzag_extract_from_regions, zigzag_embed_to_cfregions, zigzag_extract_from_cfregions
+from qtar.core.cache import ChannelAnalysis
+from qtar.core.matrixregion import MatrixRegions, divide_into_equal_regions, draw_borders_on, changed_rects, \
+    rects_sizes
+from qtar.core.transform import dct_regions, idct_regions
+from qtar.core.embeddingplan import get_plan
+from qtar.core import batch
 
 DEFAULT_PARAMS = {
     'homogeneity_threshold': 0.4,
@@ -29,6 +34,8 @@ DEFAULT_PARAMS = {
     'wmdct_mode':            False,
     'wmdct_block_size':      32,
     'wmdct_scale':           0.1,
+    'homogeneity_criterion': RANGE,
+    'tile_size':             None,
 }
 
 
@@ -45,7 +52,10 @@ class QtarStego:
                  cf_grid_size=DEFAULT_PARAMS['cf_grid_size'],
                  wmdct_mode=DEFAULT_PARAMS['wmdct_mode'],
                  wmdct_block_size=DEFAULT_PARAMS['wmdct_block_size'],
-                 wmdct_scale=DEFAULT_PARAMS['wmdct_scale']):
+                 wmdct_scale=DEFAULT_PARAMS['wmdct_scale'],
+                 homogeneity_criterion=DEFAULT_PARAMS['homogeneity_criterion'],
+                 tile_size=DEFAULT_PARAMS['tile_size'],
+                 workers=None):
         self.homogeneity_threshold = homogeneity_threshold
         self.min_block_size = min_block_size
         self.max_block_size = max_block_size
@@ -58,115 +68,222 @@ class QtarStego:
         self.wmdct_mode = wmdct_mode
         self.wmdct_block_size = wmdct_block_size
         self.wmdct_scale = wmdct_scale
+        self.homogeneity_criterion = homogeneity_criterion
+        self.tile_size = tile_size
+        self.workers = workers
+
+    def embed(self, img_container, img_watermark, resize_to_fit=True, stages=False, cache=None):
+        return self.prepare(img_container, cache).embed(img_watermark, resize_to_fit, stages)
+
+    def embed_many(self, pairs, workers=None, chunksize=1, resize_to_fit=True):
+        """
+        Embeds secret images into containers given by pairs (container, secret image) in pool of processes.
+        Returns BatchEmbedResult for every pair in order of pairs, errors of pairs are kept in their results.
+        """
+        return batch.embed_many(self, pairs, workers, chunksize, resize_to_fit)
+
+    def prepare(self, img_container, cache=None):
+        """
+        Analyzes container once for embedding of any number of secret images into it.
+        """
+        if self.tile_size:
+            container_shape = img_container.size
+            max_b = min(self.max_block_size, self.tile_size)
+            img_container = self.__prepare_image(img_container, offset=self.offset)
+        else:
+            size = int(pow(2, int(log2(min(img_container.width, img_container.height)))))
+            container_shape = (size, size)
+            max_b = min(self.max_block_size, *img_container.size)
+            img_container = self.__prepare_image(img_container, shape=container_shape, offset=self.offset)
 
-    def embed(self, img_container, img_watermark, resize_to_fit=True, stages=False):
-        size = int(pow(2, int(log2(min(img_container.width, img_container.height)))))
-
-        max_b = min(self.max_block_size, *img_container.size)
-
-        img_container = self.__prepare_image(img_container, shape=(size, size), offset=self.offset)
         chs_container = self.__convert_image_to_chs(img_container)
-        container_image_mode = img_container.mode
 
         key = Key(ch_scale=self.ch_scale,
                   offset=self.offset,
                   pm_mode=self.pm_mode,
-                  container_shape=(size, size) if self.pm_mode else None,
+                  container_shape=container_shape if self.pm_mode else None,
                   cf_mode=self.cf_mode,
                   cf_grid_size=self.cf_grid_size if self.cf_mode else None,
                   wmdct_mode=self.wmdct_mode,
                   wmdct_block_size=self.wmdct_block_size if self.wmdct_mode else None,
-                  wmdct_scale=self.wmdct_scale if self.wmdct_mode else None)
+                  wmdct_scale=self.wmdct_scale if self.wmdct_mode else None,
+                  tile_size=self.tile_size)
         container = Container(key=key)
 
+        chs_analysis = self.__analyze(chs_container, max_b, cache)
+
         chs_regions = []
         chs_pm_key = []
-        for ch, ch_image in enumerate(chs_container):
+        for ch, analysis in enumerate(chs_analysis):
+            regions = MatrixRegions(analysis.rects, chs_container[ch])
             if self.pm_mode:
-                regions = ImageQTPM(ch_image, self.min_block_size, max_b, self.homogeneity_threshold)
-                chs_pm_key.append(regions.permutation)
-            else:
-                regions = ImageQT(ch_image, self.min_block_size, max_b, self.homogeneity_threshold)
-            qt_key = regions.key
+                chs_pm_key.append(analysis.permutation)
+                regions.matrix = permutate(regions.matrix, analysis.permutation)
+            if self.tile_size:
+                key.tiles_shape = analysis.tiles_shape
 
-            regions_dct = self.__dct_regions(regions)
+            regions_dct = MatrixRegions(analysis.rects, analysis.dct)
 
             if self.cf_mode:
-                regions_embed = fit_cfregions(regions_dct, self.quant_power, self.cf_grid_size)
-                key.chs_cf_key.append(regions_embed.curves)
+                regions_embed = CFRegions.from_regions(regions_dct, analysis.cf_key, self.cf_grid_size)
+                key.chs_cf_key.append(analysis.cf_key)
             else:
-                regions_embed, ar_indexes = adapt_regions(regions_dct, q_power=self.quant_power)
+                regions_embed, ar_indexes = adapt_regions(regions_dct, ar_indexes=analysis.ar_key)
                 key.chs_ar_key.append(ar_indexes)
 
             chs_regions.append(regions)
             container.chs_regions_dct.append(regions_dct)
             container.chs_regions_dct_embed.append(regions_embed)
-            key.chs_qt_key.append(qt_key)
+            key.chs_qt_key.append(analysis.qt_key)
 
-        available_space = container.available_space
+        prepared = PreparedContainer(self, img_container, chs_container, container, chs_regions, chs_pm_key)
 
-        if available_space == 0:
+        if prepared.available_space == 0:
             raise NoSpaceError("There is no space for embedding. Try other parameters.")
 
+        return prepared
+
+    def embed_prepared(self, prepared, img_watermark, resize_to_fit=True, stages=False):
+        container_image_mode = prepared.img_container.mode
+        chs_container = prepared.chs_container
+
+        key = copy(prepared.container.key)
+        key.chs_pm_fix_key = []
+        container = Container(prepared.container.chs_regions_dct, prepared.container.chs_regions_dct_embed, key)
+
         wm_shape = img_watermark.size
         if resize_to_fit:
-            wm_size = int(sqrt(available_space))
+            wm_size = int(sqrt(prepared.available_space))
             wm_shape = (wm_size, wm_size)
-        img_watermark = self.__prepare_image(img_watermark, shape=wm_shape, mode=img_container.mode)
+        img_watermark = self.__prepare_image(img_watermark, shape=wm_shape, mode=container_image_mode)
         chs_watermark = self.__convert_image_to_chs(img_watermark)
         key.wm_shape = wm_shape
 
-        chs_stego_img = []
-        chs_embedded_dct_regions = []
+        plan = get_plan(container.chs_regions_dct_embed, key)
+        if not self.wmdct_mode:
+            for ch in range(len(chs_container)):
+                if not plan.fits(ch):
+                    warnings.warn("Container capacity is not enough for embedding given secret image."
+                                  "The extracted secret image will be incomplete.")
+
+        def embed_channel(ch):
+            return self.__embed_channel(prepared, key, plan, ch, chs_watermark[ch])
+
+        chs_embedded = map_channels(embed_channel, range(len(chs_container)), self.workers)
+        chs_stego_img = [stego_img_mx for stego_img_mx, _, _ in chs_embedded]
+        chs_embedded_dct_regions = [embedded_dct_regions for _, embedded_dct_regions, _ in chs_embedded]
+        if self.pm_mode:
+            key.chs_pm_fix_key = [ch_pm_fix for _, _, ch_pm_fix in chs_embedded]
+
+        img_stego = self.__chs_to_image(chs_stego_img, container_image_mode)
+        img_stego = self.__prepare_image(img_stego, offset=(-self.offset[0], -self.offset[1]))
+        img_container = self.__prepare_image(prepared.img_container, offset=(-self.offset[0], -self.offset[1]))
+        stages_imgs = None
+        if stages:
+            stages_imgs = LazyStages({
+                "1-container": lambda: img_container,
+                "2-quad_tree": lambda: self.__regions_to_image(prepared.chs_regions, container_image_mode,
+                                                               borders=True, only_right_bottom=True),
+                "3-adaptive_regions": lambda: self.__regions_to_image(container.chs_regions_dct_embed,
+                                                                      container_image_mode, borders=True, factor=20),
+                "4-dct": lambda: self.__regions_to_image(chs_embedded_dct_regions, container_image_mode,
+                                                         factor=20),
+                "5-watermark": lambda: img_watermark,
+                "6-stego_image": lambda: img_stego
+            })
+        return StegoEmbedResult(img_stego, key, container.fact_bpp, img_container, img_watermark, stages_imgs, plan)
+
+    def __embed_channel(self, prepared, key, plan, ch, wm_ch):
+        regions_dct = prepared.container.chs_regions_dct[ch]
+
+        if self.wmdct_mode:
+            wm_regions = divide_into_equal_regions(wm_ch, self.wmdct_block_size)
+            wm_dct_regions = dct_regions(wm_regions)
+            wm_ch = self.__quant_regions(wm_dct_regions, self.wmdct_scale).matrix
+        else:
+            wm_ch = wm_ch / 255 * self.ch_scale
 
-        chs_count = len(chs_container)
-        for ch in range(chs_count):
-            regions_dct = container.chs_regions_dct[ch]
-            embed_dct_regions = container.chs_regions_dct_embed[ch]
-            wm_ch = chs_watermark[ch]
+        embedded_dct_regions = MatrixRegions(regions_dct.rects, plan.embed(ch, copy(regions_dct.matrix), wm_ch))
 
-            if self.wmdct_mode:
-                wm_regions = divide_into_equal_regions(wm_ch, self.wmdct_block_size)
-                wm_dct_regions = self.__dct_regions(wm_regions)
-                wm_ch = self.__quant_regions(wm_dct_regions, self.wmdct_scale)
+        # only regions carrying the secret are restored by IDCT, the rest keep pixels of the container
+        stego_dct_regions = MatrixRegions(regions_dct.rects, embedded_dct_regions.matrix)
+        changed = changed_rects(regions_dct.rects, regions_dct.matrix, embedded_dct_regions.matrix)
+        stego_img_mx = idct_regions(stego_dct_regions, base=prepared.chs_regions[ch].matrix, mask=changed).matrix
 
-            embedded_dct_regions = self.__embed_in_regions(embed_dct_regions, wm_ch)
-            chs_embedded_dct_regions.append(embedded_dct_regions)
+        ch_pm_fix = None
+        if self.pm_mode:
+            pm_key = prepared.chs_pm_key[ch]
+            qt_key = key.chs_qt_key[ch]
 
-            idct_regions = MatrixRegions(regions_dct.rects, embedded_dct_regions.matrix)
-            stego_img_mx = self.__idct_regions(idct_regions).matrix
+            stego_img_mx = reverse_permutation(stego_img_mx, pm_key)
 
-            if self.pm_mode:
-                pm_key = chs_pm_key[ch]
-                qt_key = key.chs_qt_key[ch]
+            compressed_stego_img_mx = array(Image.fromarray(copy(stego_img_mx)).convert('L'))
+            distorted_regions = self.__restore_qt(compressed_stego_img_mx, key, qt_key)
+            ch_pm_fix = get_diff_fix(pm_key, distorted_regions.permutation, distorted_regions.rects)
 
-                stego_img_mx = reverse_permutation(stego_img_mx, pm_key)
+        return stego_img_mx, embedded_dct_regions, ch_pm_fix
 
-                compressed_stego_img_mx = array(Image.fromarray(copy(stego_img_mx)).convert('L'))
-                distorted_regions = ImageQTPM(compressed_stego_img_mx, key=qt_key)
-                ch_pm_fix = get_diff_fix(pm_key, distorted_regions.permutation, distorted_regions.rects)
+    def __analyze(self, chs_container, max_b, cache=None):
+        def analyze_channel(ch_image):
+            return self.__analyze_channel(ch_image, max_b)
 
-                key.chs_pm_fix_key.append(ch_pm_fix)
+        if cache is None:
+            return map_channels(analyze_channel, chs_container, self.workers)
 
-            chs_stego_img.append(stego_img_mx)
+        digest = cache.digest(chs_container, self.__analysis_params(max_b))
+        chs_analysis = cache.load(digest)
+        if chs_analysis is None:
+            chs_analysis = map_channels(analyze_channel, chs_container, self.workers)
+            cache.store(digest, chs_analysis)
+        return chs_analysis
 
-        img_stego = self.__chs_to_image(chs_stego_img, container_image_mode)
-        img_stego = self.__prepare_image(img_stego, offset=(-self.offset[0], -self.offset[1]))
-        img_container = self.__prepare_image(img_container, offset=(-self.offset[0], -self.offset[1]))
-        stages_imgs = None
-        if stages:
-            stages_imgs = {
-                "1-container": img_container,
-                "2-quad_tree": self.__regions_to_image(chs_regions, container_image_mode,
-                                                       borders=True, only_right_bottom=True),
-                "3-adaptive_regions": self.__regions_to_image(container.chs_regions_dct_embed, container_image_mode,
-                                                              borders=True, factor=20),
-                "4-dct": self.__regions_to_image(chs_embedded_dct_regions, container_image_mode,
-                                                 factor=20),
-                "5-watermark": img_watermark,
-                "6-stego_image": img_stego
-            }
-        return StegoEmbedResult(img_stego, key, container.fact_bpp, img_container, img_watermark, stages_imgs)
+    def __analyze_channel(self, ch_image, max_b):
+        # permutation mode aligns blocks of the matrix in place, the container itself must stay intact
+        regions = self.__build_qt(copy(ch_image) if self.pm_mode else ch_image, max_b)
+        regions_dct = dct_regions(regions)
+
+        ar_key = cf_key = None
+        if self.cf_mode:
+            cf_key = fit_cfregions(regions_dct, self.quant_power, self.cf_grid_size).curves
+        else:
+            ar_key = adapt_regions(regions_dct, q_power=self.quant_power)[1]
+
+        return ChannelAnalysis(regions.key, regions.rects, regions_dct.matrix, ar_key, cf_key,
+                               permutation=regions.permutation if self.pm_mode else None,
+                               tiles_shape=regions.tiles_shape if self.tile_size else None)
+
+    def __analysis_params(self, max_b):
+        return {
+            'homogeneity_threshold': self.homogeneity_threshold,
+            'homogeneity_criterion': self.homogeneity_criterion,
+            'min_block_size': self.min_block_size,
+            'max_block_size': max_b,
+            'quant_power': self.quant_power,
+            'offset': self.offset,
+            'pm_mode': self.pm_mode,
+            'cf_mode': self.cf_mode,
+            'cf_grid_size': self.cf_grid_size if self.cf_mode else None,
+            'tile_size': self.tile_size
+        }
+
+    def __build_qt(self, ch_image, max_b):
+        if self.tile_size:
+            return ImageQTForest(ch_image, self.tile_size, self.min_block_size, max_b, self.homogeneity_threshold,
+                                 criterion=self.homogeneity_criterion, pm_mode=self.pm_mode, workers=self.workers)
+        if self.pm_mode:
+            return ImageQTPM(ch_image, self.min_block_size, max_b, self.homogeneity_threshold,
+                             criterion=self.homogeneity_criterion)
+        return ImageQT(ch_image, self.min_block_size, max_b, self.homogeneity_threshold,
+                       criterion=self.homogeneity_criterion)
+
+    @staticmethod
+    def __restore_qt(ch_image, key, qt_key, permutation=None):
+        if key.tiled:
+            return ImageQTForest(ch_image, key.tile_size, key=qt_key, pm_mode=key.pm_mode,
+                                 permutation=permutation, tiles_shape=key.tiles_shape)
+        if key.pm_mode:
+            return ImageQTPM(ch_image, key=qt_key, permutation=permutation)
+        return ImageQT(ch_image, key=qt_key)
 
     @staticmethod
     def __prepare_image(image, shape=None, offset=None, mode=None):
@@ -179,19 +296,6 @@ class QtarStego:
             image = image.convert(mode)
         return image
 
-    @staticmethod
-    def __dct_regions(regions, inverse=False):
-        size = regions.matrix.shape[0]
-        mx_result = zeros((size, size))
-        regions_dct = MatrixRegions(regions.rects, mx_result)
-        for i, region in enumerate(regions):
-            if inverse:
-                region_dct = idct(idct(region.T, norm='ortho').T, norm='ortho')
-            else:
-                region_dct = dct(dct(region, norm='ortho').T, norm='ortho').T
-            regions_dct[i] = region_dct
-        return regions_dct
-
     @staticmethod
     def __quant_regions(regions, scale):
         quantized = MatrixRegions(regions.rects, copy(regions.matrix))
@@ -211,121 +315,127 @@ class QtarStego:
         return dequantized
 
     @classmethod
-    def __idct_regions(cls, regions):
-        return cls.__dct_regions(regions, True)
-
-    def __embed_in_regions(self, regions, ch_watermark):
-        if self.cf_mode:
-            regions = CFRegions(regions.rects, copy(regions.matrix), regions.curves, self.cf_grid_size)
-            if self.wmdct_mode:
-                return zigzag_embed_to_cfregions(ch_watermark, regions)
-
-        else:
-            regions = MatrixRegions(regions.rects, copy(regions.matrix))
-            if self.wmdct_mode:
-                return zigzag_embed_to_regions(ch_watermark, regions)
-
-        wm_iter = ch_watermark.flat
-
-        for i in range(0, len(regions)):
-            region = regions[i]
-            size = region.size
-            shape = region.shape
-            region_stego = array(list(islice(wm_iter, size)))
-
-            if region_stego.size == 0:
-                if size == 0:
-                    continue
-                else:
-                    return regions
-
-            region_stego = region_stego / 255 * self.ch_scale
-            region_stego = append(region_stego, region.flat[region_stego.size:size])
-            region_stego = region_stego.reshape(shape)
-            regions[i] = region_stego
-
-        try:
-            next(wm_iter)
-        except StopIteration:
-            pass
-        else:
-            warnings.warn("Container capacity is not enough for embedding given secret image."
-                          "The extracted secret image will be incomplete.")
-        return regions
+    def extract(cls, img_stego, key, stages=False, plan=None, workers=None):
+        return cls.extract_restored(cls.restore(img_stego, key, workers), key, stages, plan, workers)
 
     @classmethod
-    def extract(cls, img_stego, key, stages=False):
+    def restore(cls, img_stego, key, workers=None):
+        """The first stage of extraction: quad trees and regions holding the secret restored from stego image by key."""
         img_stego = cls.__prepare_image(img_stego, offset=key.offset)
         chs_stego = cls.__convert_image_to_chs(img_stego)
-        stego_image_mode = img_stego.mode
 
-        chs_regions = []
-        chs_regions_extract = []
-        chs_watermark = []
-        for ch, ch_stego in enumerate(chs_stego):
-            qt_key = key.chs_qt_key[ch]
+        def restore_channel(ch):
+            return cls.__restore_channel_regions(chs_stego[ch], key, ch)
 
-            if key.pm_mode:
-                pm_fix_key = key.chs_pm_fix_key[ch]
-                distorted_regions = ImageQTPM(copy(ch_stego), key=qt_key)
-                distorted_pm_mx_regions = MatrixRegions(distorted_regions.rects, distorted_regions.permutation)
-                pm_key = fix_diff(distorted_pm_mx_regions, pm_fix_key).matrix
-                regions = ImageQTPM(copy(ch_stego), key=qt_key, permutation=pm_key)
-            else:
-                regions = ImageQT(ch_stego, key=qt_key)
+        chs_restored = map_channels(restore_channel, range(len(chs_stego)), workers)
+        return RestoredStego(img_stego.mode,
+                             [regions for regions, _ in chs_restored],
+                             [regions_extract for _, regions_extract in chs_restored])
 
-            regions_dct = cls.__dct_regions(regions)
+    @classmethod
+    def extract_restored(cls, restored, key, stages=False, plan=None, workers=None):
+        """The second stage of extraction: secret image read from DCT of restored regions."""
+        stego_image_mode = restored.mode
+        chs_regions = restored.chs_regions
+        chs_regions_extract = restored.chs_regions_extract
+
+        if plan is None:
+            plan = get_plan(chs_regions_extract, key)
+        else:
+            plan.validate(key, chs_regions_extract[0].matrix.shape)
+
+        def extract_channel(ch):
+            return cls.__extract_channel(chs_regions[ch], chs_regions_extract[ch], key, plan, ch)
+
+        chs_watermark = map_channels(extract_channel, range(len(chs_regions)), workers)
+
+        img_watermark = cls.__chs_to_image(chs_watermark, stego_image_mode)
+        if not stages:
+            return img_watermark
+
+        def full_dct_regions():
+            # extraction transforms only regions holding the secret, the stage shows all of them
+            chs_regions_dct = []
+            for regions, regions_extract in zip(chs_regions, chs_regions_extract):
+                regions_dct = copy(regions_extract)
+                regions_dct.matrix = dct_regions(regions).matrix
+                chs_regions_dct.append(regions_dct)
+            return chs_regions_dct
+
+        return LazyStages({
+            "7-quad_tree": lambda: cls.__regions_to_image(chs_regions, stego_image_mode,
+                                                          borders=True, only_right_bottom=True),
+            "8-adaptive_regions": lambda: cls.__regions_to_image(full_dct_regions(), stego_image_mode,
+                                                                 borders=True, factor=10),
+            "9-extracted_watermark": lambda: img_watermark
+        })
 
-            if key.cf_mode:
-                cf_key = key.chs_cf_key[ch]
-                regions_extract = CFRegions.from_regions(regions_dct, cf_key, key.cf_grid_size)
-            else:
-                ar_indexes = key.chs_ar_key[ch]
-                regions_extract, ar_indexes = adapt_regions(regions_dct, ar_indexes=ar_indexes)
-
-            if key.wmdct_mode:
-                wm_quantized_regions = cls.__extract_from_regions(regions_extract, key)
-                wm_dct_regions = cls.__dequant_regions(wm_quantized_regions, key.wmdct_scale)
-                wm_regions = cls.__idct_regions(wm_dct_regions)
-                ch_watermark = wm_regions.matrix
-            else:
-                ch_watermark = cls.__extract_from_regions(regions_extract, key)
+    @classmethod
+    def extract_many(cls, items, workers=None, chunksize=1):
+        """
+        Extracts secret images from pairs (stego image, key) in pool of processes, key may be Key or its bytes.
+        Returns BatchExtractResult for every pair in order of pairs, errors of pairs are kept in their results.
+        """
+        return batch.extract_many(cls, items, workers, chunksize)
 
-            chs_regions.append(regions)
-            chs_regions_extract.append(regions_extract)
-            chs_watermark.append(ch_watermark)
+    @classmethod
+    def __restore_channel_regions(cls, ch_stego, key, ch):
+        qt_key = key.chs_qt_key[ch]
+
+        if key.pm_mode:
+            pm_fix_key = key.chs_pm_fix_key[ch]
+            distorted_regions = cls.__restore_qt(copy(ch_stego), key, qt_key)
+            distorted_pm_mx_regions = MatrixRegions(distorted_regions.rects, distorted_regions.permutation)
+            pm_key = fix_diff(distorted_pm_mx_regions, pm_fix_key).matrix
+            regions = cls.__restore_qt(copy(ch_stego), key, qt_key, pm_key)
+        else:
+            regions = cls.__restore_qt(ch_stego, key, qt_key)
 
-        if stages:
-            stages_imgs = {
-                "7-quad_tree": cls.__regions_to_image(chs_regions, stego_image_mode,
-                                                      borders=True, only_right_bottom=True),
-                "8-adaptive_regions": cls.__regions_to_image(chs_regions_extract, stego_image_mode,
-                                                             borders=True, factor=10),
-                "9-extracted_watermark": cls.__chs_to_image(chs_watermark, stego_image_mode)
-            }
-            return stages_imgs
+        if key.cf_mode:
+            cf_key = key.chs_cf_key[ch]
+            regions_extract = CFRegions.from_regions(regions, cf_key, key.cf_grid_size)
         else:
-            return cls.__chs_to_image(chs_watermark, stego_image_mode)
+            ar_indexes = key.chs_ar_key[ch]
+            regions_extract, ar_indexes = adapt_regions(regions, ar_indexes=ar_indexes)
+
+        return regions, regions_extract
 
     @classmethod
-    def __extract_from_regions(cls, regions, key):
+    def __extract_channel(cls, regions, regions_extract, key, plan, ch):
+        # only regions holding the secret are transformed
+        regions_extract.matrix = dct_regions(regions, mask=cls.__payload_mask(regions_extract, key)).matrix
+
+        ch_watermark = plan.extract(ch, regions_extract.matrix).reshape(plan.secret_shape)
         if key.wmdct_mode:
-            if key.cf_mode:
-                return zigzag_extract_from_cfregions(regions, key.wm_shape, key.wmdct_block_size)
-            else:
-                return zigzag_extract_from_regions(regions, key.wm_shape, key.wmdct_block_size)
+            wm_quantized_regions = divide_into_equal_regions(ch_watermark, key.wmdct_block_size)
+            wm_dct_regions = cls.__dequant_regions(wm_quantized_regions, key.wmdct_scale)
+            wm_regions = idct_regions(wm_dct_regions)
+            return wm_regions.matrix
+        return ch_watermark * 255 / key.ch_scale
 
-        region_stego = array([])
+    @staticmethod
+    def __payload_mask(regions, key):
+        """
+        Marks regions holding the secret image: sizes of regions are known from the key without their values.
+        """
         wm_size = key.wm_shape[0] * key.wm_shape[1]
-        for region in regions:
-            region = region.flatten()
-            region_stego = append(region_stego, region)
-            if region_stego.size >= wm_size:
+
+        mask = zeros(len(regions), bool)
+        read = 0
+        for i, size in enumerate(QtarStego.__regions_sizes(regions, key.cf_mode)):
+            if read >= wm_size:
                 break
-        else:
-            region_stego = append(region_stego, zeros(wm_size - region_stego.size))
-        ch_watermark = region_stego[0:wm_size].reshape(key.wm_shape)
-        return ch_watermark * 255 / key.ch_scale
+            mask[i] = size > 0
+            # secret DCT coefficients go round-robin, one to every region per round, flat secret fills regions in turn
+            read += min(size, 1) if key.wmdct_mode else size
+        return mask
+
+    @staticmethod
+    def __regions_sizes(regions, cf_mode):
+        """Sizes of regions in the order the secret is written."""
+        if cf_mode:
+            return regions.cfregions_sizes()
+        return rects_sizes(regions.rects)
 
     @staticmethod
     def __convert_image_to_chs(image):
@@ -391,18 +501,85 @@ class QtarStego:
             'cf_grid_size': self.cf_grid_size,
             'wmdct_mode': self.wmdct_mode,
             'wmdct_block_size': self.wmdct_block_size,
-            'wmdct_scale': self.wmdct_scale
+            'wmdct_scale': self.wmdct_scale,
+            'homogeneity_criterion': self.homogeneity_criterion,
+            'tile_size': self.tile_size
         }
 
 
+def map_channels(func, chs, workers=None):
+    """
+    Results of func for every channel in order of channels,
+    channels are processed by a pool of workers threads if workers is given.
+    """
+    if not workers:
+        return list(map(func, chs))
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(func, chs))
+
+
+class PreparedContainer:
+    """
+    Container analyzed by QtarStego.prepare: its channels, quad trees, DCT of regions and regions to embed into.
+    Embedding into prepared container only writes secret image and restores stego image by IDCT.
+    """
+    def __init__(self, qtar, img_container, chs_container, container, chs_regions, chs_pm_key=None):
+        self.qtar = qtar
+        self.img_container = img_container
+        self.chs_container = chs_container
+        self.container = container
+        self.chs_regions = chs_regions
+        self.chs_pm_key = chs_pm_key or []
+        self.available_space = container.available_space
+
+    def embed(self, img_watermark, resize_to_fit=True, stages=False):
+        return self.qtar.embed_prepared(self, img_watermark, resize_to_fit, stages)
+
+    @property
+    def available_bpp(self):
+        return self.container.available_bpp
+
+
+class RestoredStego:
+    """
+    Stego image restored by QtarStego.restore: its quad tree regions and regions holding the secret of every channel.
+    Extraction writes DCT into regions holding the secret, so restored stego image is extracted from once.
+    """
+    def __init__(self, mode, chs_regions, chs_regions_extract):
+        self.mode = mode
+        self.chs_regions = chs_regions
+        self.chs_regions_extract = chs_regions_extract
+
+
+class LazyStages(Mapping):
+    """
+    Images of stages of embedding or extraction by their names, every image is rendered when it is accessed first.
+    """
+    def __init__(self, renderers):
+        self.renderers = renderers
+        self.rendered = {}
+
+    def __getitem__(self, name):
+        if name not in self.rendered:
+            self.rendered[name] = self.renderers[name]()
+        return self.rendered[name]
+
+    def __iter__(self):
+        return iter(self.renderers)
+
+    def __len__(self):
+        return len(self.renderers)
+
+
 class StegoEmbedResult:
-    def __init__(self, img_stego, key, bpp, img_container=None, img_watermark=None, stages_imgs=None):
+    def __init__(self, img_stego, key, bpp, img_container=None, img_watermark=None, stages_imgs=None, plan=None):
         self.img_stego = img_stego
         self.img_container = img_container
         self.img_watermark = img_watermark
         self.key = key
         self.bpp = bpp
         self.stages_imgs = stages_imgs
+        self.plan = plan
 
 
 class NoSpaceError(Exception): pass
\ No newline at end of file
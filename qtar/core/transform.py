@@ -0,0 +1,219 @@
+from functools import lru_cache
+from timeit import default_timer as timer
+
+import numpy as np
+from scipy.fftpack import dct, idct
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+from qtar.core.matrixregion import MatrixRegions
+
+FFTPACK = 'fftpack'
+FFT = 'fft'
+MATMUL = 'matmul'
+AUTO = 'auto'
+
+# blocks up to this area are transformed by Kronecker product of bases
+KRON_MAX_AREA = 64
+
+# stacks of more blocks than this are benchmarked on their first blocks only
+AUTO_BENCHMARK_BLOCKS = 256
+
+
+class FftpackBackend:
+    name = FFTPACK
+
+    @staticmethod
+    def dct2(stack):
+        return dct(dct(stack, axis=2, norm='ortho'), axis=1, norm='ortho')
+
+    @staticmethod
+    def idct2(stack):
+        return idct(idct(stack, axis=1, norm='ortho'), axis=2, norm='ortho')
+
+
+class FftBackend:
+    name = FFT
+
+    def __init__(self, workers=-1):
+        self.workers = workers
+
+    def dct2(self, stack):
+        return scipy_fft.dctn(stack, axes=(1, 2), norm='ortho', workers=self.workers)
+
+    def idct2(self, stack):
+        return scipy_fft.idctn(stack, axes=(1, 2), norm='ortho', workers=self.workers)
+
+
+class MatmulBackend:
+    """
+    Transforms blocks by multiplication with cached orthonormal DCT-II basis: C @ X @ C.T.
+    Small blocks are flattened and multiplied by Kronecker product of bases, so whole stack is one matrix product.
+    """
+    name = MATMUL
+
+    @classmethod
+    def dct2(cls, stack):
+        return cls.transform(stack, False)
+
+    @classmethod
+    def idct2(cls, stack):
+        return cls.transform(stack, True)
+
+    @staticmethod
+    def transform(stack, inverse):
+        count, h, w = stack.shape
+        if h * w <= KRON_MAX_AREA:
+            return np.dot(stack.reshape((count, h * w)), kron_basis(h, w, inverse)).reshape(stack.shape)
+        if inverse:
+            return dct_basis(h).T @ stack @ dct_basis(w)
+        return dct_basis(h) @ stack @ dct_basis(w).T
+
+
+class AutoBackend:
+    """
+    Chooses the fastest of backends for every shape of blocks by benchmark on the first stack of that shape.
+    """
+    name = AUTO
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.choices = {}
+
+    def dct2(self, stack):
+        return self.choose(stack, False).dct2(stack)
+
+    def idct2(self, stack):
+        return self.choose(stack, True).idct2(stack)
+
+    def choose(self, stack, inverse):
+        shape = stack.shape[1:], inverse
+        if shape not in self.choices:
+            sample = np.ascontiguousarray(stack[:AUTO_BENCHMARK_BLOCKS])
+            self.choices[shape] = min(self.backends, key=lambda backend: benchmark_backend(backend, sample, inverse))
+        return self.choices[shape]
+
+
+BACKENDS = {
+    FFTPACK: FftpackBackend(),
+    MATMUL: MatmulBackend()
+}
+if scipy_fft is not None:
+    BACKENDS[FFT] = FftBackend()
+BACKENDS[AUTO] = AutoBackend(list(BACKENDS.values()))
+
+_default_backend = BACKENDS[FFTPACK]
+
+
+def set_default_backend(name):
+    """
+    Sets backend used by dct_regions when none is given.
+    fftpack gives the same results as earlier versions, others may differ in the last bits.
+    """
+    global _default_backend
+    _default_backend = get_backend(name)
+
+
+def get_backend(name=None):
+    if name is None:
+        return _default_backend
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise WrongBackendError("Unknown transform backend: %s" % name)
+
+
+def dct_regions(regions, inverse=False, backend=None, base=None, mask=None):
+    """
+    2-D DCT (or IDCT) of every region, regions of the same shape are transformed together in one stack.
+
+    If mask is given only regions marked in it are transformed,
+    the rest of result is taken from base matrix (zeros by default).
+    """
+    backend = get_backend(backend)
+    if base is None:
+        mx_result = np.zeros(regions.matrix.shape)
+    else:
+        mx_result = np.array(base, np.float64)
+    rects = regions.rects
+    if mask is not None:
+        rects = np.asarray(rects, np.int64).reshape((-1, 4))[np.asarray(mask, bool)]
+    for shape, (ys, xs) in size_classes(rects, regions.matrix.shape).items():
+        rows, cols = stack_indexes(ys, xs, shape)
+        stack = regions.matrix[rows, cols].astype(np.float64, copy=False)
+        mx_result[rows, cols] = backend.idct2(stack) if inverse else backend.dct2(stack)
+    return MatrixRegions(regions.rects, mx_result)
+
+
+def idct_regions(regions, backend=None, base=None, mask=None):
+    return dct_regions(regions, True, backend, base, mask)
+
+
+@lru_cache(maxsize=None)
+def dct_basis(size):
+    """Orthonormal DCT-II matrix, rows are basis vectors."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    basis = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    basis[0] /= np.sqrt(2)
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=None)
+def kron_basis(h, w, inverse=False):
+    """Matrix to transform flattened h x w blocks multiplied from the right."""
+    basis = np.kron(dct_basis(h), dct_basis(w))
+    basis = np.ascontiguousarray(basis if inverse else basis.T)
+    basis.setflags(write=False)
+    return basis
+
+
+def benchmark_backend(backend, stack, inverse=False, repeat=3):
+    transform = backend.idct2 if inverse else backend.dct2
+    times = []
+    for _ in range(repeat):
+        start = timer()
+        transform(stack)
+        times.append(timer() - start)
+    return min(times)
+
+
+def size_classes(rects, matrix_shape):
+    """
+    Groups rects by shape of their regions clipped by the matrix.
+
+    Returns dict of shape (height, width) to arrays of top and left coordinates of the rects.
+    """
+    height, width = matrix_shape
+    rects = np.asarray(rects, np.int64).reshape((-1, 4))
+    x0, y0 = np.minimum(rects[:, 0], width), np.minimum(rects[:, 1], height)
+    x1, y1 = np.minimum(rects[:, 2], width), np.minimum(rects[:, 3], height)
+    heights, widths = np.maximum(y1 - y0, 0), np.maximum(x1 - x0, 0)
+
+    classes = {}
+    nonempty = (heights > 0) & (widths > 0)
+    shapes = np.stack((heights, widths), axis=1)[nonempty]
+    if shapes.size == 0:
+        return classes
+    unique_shapes, class_ids = np.unique(shapes, axis=0, return_inverse=True)
+    class_ids = class_ids.ravel()
+    for class_id, (h, w) in enumerate(unique_shapes.tolist()):
+        in_class = class_ids == class_id
+        classes[(h, w)] = (y0[nonempty][in_class], x0[nonempty][in_class])
+    return classes
+
+
+def stack_indexes(ys, xs, shape):
+    """Index arrays to gather regions of the same shape with given corners into stack of shape (count, h, w)."""
+    h, w = shape
+    rows = ys[:, None, None] + np.arange(h)[None, :, None]
+    cols = xs[:, None, None] + np.arange(w)[None, None, :]
+    return rows, cols
+
+
+class WrongBackendError(Exception):
+    pass
@@ -1,41 +1,23 @@
-from itertools import count, chain, zip_longest
-from functools import lru_cache
+from itertools import count
 from copy import copy
 
 import numpy as np
 
+from qtar.core.cache import ArraysCache
 from qtar.core.matrixregion import MatrixRegions, divide_into_equal_regions
-from qtar.core.curvefitting import CFRegions
+from qtar.core.curvefitting import CFRegions, cf_mask
 
 
 def zigzag_embed_to_cfregions(wm_regions, cf_regions: CFRegions):
-    wm_iter = zigzag_order_regions(wm_regions)
-    wm_by_regions = sort_wm_by_regions(wm_iter, cf_regions)
+    wm_data = zigzag_order_regions(wm_regions)
+    wm_by_regions = sort_wm_by_regions(wm_data, cf_regions)
 
     result_regions = CFRegions(cf_regions.rects, copy(cf_regions.matrix), cf_regions.curves, cf_regions.grid_size)
 
-    for i, region, wm_data in zip(count(), result_regions.columned_regions(), wm_by_regions):
-        x0, y0, x1, y1 = cf_regions.rects[i]
-        shape = y1 - y0, x1 - x0
-        height, width = shape
-
-        zz_order = zigzag_order(shape)
-        indices = iter(zz_order[::-1])
-
-        for wm_data_item in wm_data:
-            for y, x in indices:
-                y = y - (height - region[x].size)
-
-                if y < 0:
-                    continue
-
-                try:
-                    region[x][y] = wm_data_item
-                    break
-                except IndexError:
-                    continue
-
-        result_regions.set_cfregion_columns(result_regions.rects[i], result_regions.curves[i], region)
+    for rect, curve, wm_data in zip(result_regions.rects, result_regions.curves, wm_by_regions):
+        region = result_regions.get_region(rect)
+        positions = cf_reversed_zigzag_order(region.shape, curve, cf_regions.grid_size)[:wm_data.size]
+        region[positions[:, 0], positions[:, 1]] = wm_data
 
     return result_regions
 
@@ -46,50 +28,13 @@ def zigzag_extract_from_cfregions(cf_regions: CFRegions, wm_shape, wm_block_size
     wm_regions_sizes = [wm_region.size for wm_region in wm_regions]
     wm_data_by_regions = []
 
-    for i, region in enumerate(cf_regions.columned_regions()):
-        x0, y0, x1, y1 = cf_regions.rects[i]
-        shape = y1 - y0, x1 - x0
-        height, width = shape
-
-        size = cf_regions.get_cfregion_size(i)
-
-        zz_order = zigzag_order(shape)
-        indices = iter(zz_order[::-1])
-
-        wm_data = []
-
-        for _ in range(size):
-            for y, x in indices:
-                y = y - (height - region[x].size)
-
-                if y < 0:
-                    continue
-
-                try:
-                    wm_data.append(region[x][y])
-                    break
-                except IndexError:
-                    continue
-
-        wm_data_by_regions.append(wm_data)
+    for rect, curve in zip(cf_regions.rects, cf_regions.curves):
+        region = cf_regions.get_region(rect)
+        positions = cf_reversed_zigzag_order(region.shape, curve, cf_regions.grid_size)
+        wm_data_by_regions.append(region[positions[:, 0], positions[:, 1]])
 
     wm_data_flat = interweave(wm_data_by_regions)
-    wm_flat_regions = [[] for _ in range(len(wm_regions))]
-    wm_flat_regions_filled = [False for _ in range(len(wm_regions))]
-
-    while not all(wm_flat_regions_filled):
-        for i, wm_region_size, wm_flat_region in zip(count(), wm_regions_sizes, wm_flat_regions):
-            if wm_flat_regions_filled[i]:
-                continue
-
-            if len(wm_flat_region) >= wm_region_size:
-                wm_flat_regions_filled[i] = True
-                continue
-
-            try:
-                wm_flat_regions[i].append(next(wm_data_flat))
-            except StopIteration:
-                break
+    wm_flat_regions = distribute(wm_data_flat, wm_regions_sizes)
 
     for i, wm_region in enumerate(wm_flat_regions):
         shape = wm_regions[i].shape
@@ -99,14 +44,14 @@ def zigzag_extract_from_cfregions(cf_regions: CFRegions, wm_shape, wm_block_size
 
 
 def zigzag_embed_to_regions(wm_regions, mx_regions: MatrixRegions):
-    wm_iter = zigzag_order_regions(wm_regions)
-    wm_by_regions = sort_wm_by_regions(wm_iter, mx_regions)
+    wm_data = zigzag_order_regions(wm_regions)
+    wm_by_regions = sort_wm_by_regions(wm_data, mx_regions)
 
     result_regions = MatrixRegions(mx_regions.rects, copy(mx_regions.matrix))
 
     for i, region, wm_data in zip(count(), mx_regions, wm_by_regions):
         size = region.size
-        np_wm_data = np.array(wm_data)[::-1]
+        np_wm_data = wm_data[::-1]
 
         if size > np_wm_data.size:
             zz_region = zigzag_from_mx(region)
@@ -124,25 +69,7 @@ def zigzag_extract_from_regions(mx_regions, wm_shape, wm_block_size):
 
     wm_data_by_regions = [zigzag_from_mx(region)[::-1] for region in mx_regions]
     wm_data_flat = interweave(wm_data_by_regions)
-
-    wm_regions_count = len(wm_regions)
-
-    wm_flat_regions = [[] for _ in range(wm_regions_count)]
-    wm_flat_regions_filled = [False for _ in range(wm_regions_count)]
-
-    while not all(wm_flat_regions_filled):
-        for i, wm_region_size, wm_flat_region in zip(count(), wm_regions_sizes, wm_flat_regions):
-            if wm_flat_regions_filled[i]:
-                continue
-
-            if len(wm_flat_region) >= wm_region_size:
-                wm_flat_regions_filled[i] = True
-                continue
-
-            try:
-                wm_flat_regions[i].append(next(wm_data_flat))
-            except StopIteration:
-                break
+    wm_flat_regions = distribute(wm_data_flat, wm_regions_sizes)
 
     for i, wm_region in enumerate(wm_flat_regions):
         shape = wm_regions[i].shape
@@ -151,28 +78,23 @@ def zigzag_extract_from_regions(mx_regions, wm_shape, wm_block_size):
     return wm_regions
 
 
-def sort_wm_by_regions(wm_iter, mx_regions):
-    regions_count = len(mx_regions)
-    regions_sizes = [region.size for region in mx_regions]
-    wm_data_by_regions = [[] for _ in range(regions_count)]
-    wm_data_by_regions_filled = [False for _ in range(regions_count)]
-
-    while not all(wm_data_by_regions_filled):
-        for i, wm_data, region_size in zip(count(), wm_data_by_regions, regions_sizes):
-            if wm_data_by_regions_filled[i]:
-                continue
+def sort_wm_by_regions(wm_data, mx_regions):
+    """Secret data given to regions in turns, one element to every region not filled yet per turn."""
+    return distribute(wm_data, [region.size for region in mx_regions])
 
-            if len(wm_data) >= region_size:
-                wm_data_by_regions_filled[i] = True
-                continue
 
-            try:
-                new_wm_data = next(wm_iter)
-                wm_data.append(new_wm_data)
-            except StopIteration:
-                return wm_data_by_regions
-
-    return wm_data_by_regions
+def distribute(data, sizes):
+    """
+    Splits data into parts of at most given sizes taking elements in turns: the first one to every part,
+    then the second one to every part not filled yet and so on. Parts are shorter when data runs out.
+    """
+    data = np.asarray(data)
+    sizes = np.asarray(sizes, np.int64)
+    order = round_robin(sizes, data.size)
+    flat = data[:order.size][np.argsort(order)]
+    # every part gets the prefix of its turns, so parts are found by counts of their elements
+    counts = np.bincount(np.repeat(np.arange(sizes.size), sizes)[order], minlength=sizes.size)
+    return np.split(flat, np.cumsum(counts)[:-1])
 
 
 def zigzag_from_mx(mx):
@@ -191,57 +113,91 @@ def zigzag_order_regions(regions):
 
 
 def interweave(arrays):
-    iters = [iter(array) for array in arrays]
-    finished = [False for _ in iters]
-    while not all(finished):
-        for i, it, is_finished in zip(count(), iters, finished):
-            if is_finished:
-                continue
-            try:
-                yield next(it)
-            except StopIteration:
-                finished[i] = True
-
-
-@lru_cache(maxsize=None)
-def zigzag(shape):
-    h, w = shape
+    """Elements of arrays taken in turns: the first ones of every array, then the second ones and so on."""
+    arrays = [np.ravel(array) for array in arrays]
+    if not arrays:
+        return np.zeros(0)
+    return np.concatenate(arrays)[round_robin([array.size for array in arrays])]
+
+
+def round_robin(sizes, count=None):
+    """
+    Flat indexes of elements of parts of given sizes laid one after another, in order of turns over the parts.
+    Only the first count indexes are found if count is given.
+    """
+    sizes = np.asarray(sizes, np.int64)
+    parts = np.repeat(np.arange(sizes.size), sizes)
+    ranks = np.arange(parts.size) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return round_robin_order(parts, ranks, parts.size if count is None else count)
+
+
+def round_robin_order(slots_regions, slots_ranks, count):
+    """
+    Order of slots taken by turns: first element of every region, then second element of every region and so on.
+    Only the first count slots are ordered.
+    """
+    if slots_ranks.size == 0:
+        return np.zeros(0, np.int64)
+    # slots taken before every turn, turns after the one which takes count-th slot are not needed
+    turn_sizes = np.bincount(slots_ranks)
+    taken_before = np.cumsum(turn_sizes) - turn_sizes
+    turns = int(np.searchsorted(taken_before, count, side='left'))
+    needed = np.flatnonzero(slots_ranks < turns)
+    order = np.lexsort((slots_regions[needed], slots_ranks[needed]))
+    return needed[order[:count]]
+
+
+# max total size of zigzag tables of all shapes kept in memory
+ZIGZAG_CACHE_SIZE = 32 * 1024 ** 2
+
+zigzag_cache = ArraysCache(ZIGZAG_CACHE_SIZE)
+
 
-    def move(i, j, n):
-        if j < (n - 1):
-            return max(0, i-1), j+1
-        else:
-            return i+1, j
+def zigzag(shape):
+    """Matrix of given shape (height, width) of indexes of its elements in zigzag order."""
+    shape = tuple(shape)
+    return zigzag_cache.get(('zigzag', shape), lambda: build_zigzag(shape))
 
-    a = np.zeros((h, w))
-    x, y = 0, 0
-    for v in range(w * h):
-        a[y][x] = v
-        if (x + y) & 1:
-            x, y = move(x, y, h)
-        else:
-            y, x = move(y, x, w)
 
-    return a.astype(int)
+def zigzag_positions(shape):
+    """Flat positions of elements of matrix of given shape in zigzag order."""
+    shape = tuple(shape)
+    return zigzag_cache.get(('positions', shape), lambda: build_zigzag_positions(shape))
 
 
-# @lru_cache(maxsize=None)
 def zigzag_order(shape):
+    """Positions (y, x) of elements of matrix of given shape in zigzag order, array of shape (height * width, 2)."""
+    shape = tuple(shape)
+    return zigzag_cache.get(('order', shape), lambda: build_zigzag_order(shape))
+
+
+def build_zigzag_positions(shape):
+    # anti-diagonals go one after another, even ones from bottom-left to top-right, odd ones back
     h, w = shape
+    y, x = np.divmod(np.arange(h * w, dtype=np.int32), w)
+    diagonal = y + x
+    return np.lexsort((np.where(diagonal & 1, y, x), diagonal)).astype(np.int32)
+
+
+def build_zigzag(shape):
+    positions = zigzag_positions(shape)
+    result = np.empty(positions.size, np.int32)
+    result[positions] = np.arange(positions.size, dtype=np.int32)
+    return result.reshape(shape)
+
+
+def build_zigzag_order(shape):
+    y, x = np.divmod(zigzag_positions(shape), shape[1])
+    return np.stack((y, x), axis=1).astype(np.int32)
+
+
+def cf_reversed_zigzag_order(shape, curve, grid_size):
+    """Positions (y, x) of elements of curve-fitting region in reversed zigzag order of its rect, shape (size, 2)."""
+    shape = tuple(shape)
+    key = ('cf reversed', shape, tuple(curve), grid_size)
+    return zigzag_cache.get(key, lambda: build_cf_reversed_zigzag_order(shape, curve, grid_size))
+
 
-    def move(i, j, n):
-        if j < (n - 1):
-            return max(0, i-1), j+1
-        else:
-            return i+1, j
-
-    a = []
-    x, y = 0, 0
-    for v in range(w * h):
-        a.append((y, x))
-        if (x + y) & 1:
-            x, y = move(x, y, h)
-        else:
-            y, x = move(y, x, w)
-
-    return a
\ No newline at end of file
+def build_cf_reversed_zigzag_order(shape, curve, grid_size):
+    order = zigzag_order(shape)[::-1]
+    return np.ascontiguousarray(order[cf_mask(shape, curve, grid_size)[order[:, 0], order[:, 1]]])
@@ -12,7 +12,9 @@ PARAMS_NAMES = {
     'cf_grid_size': 'cf, px',
     'wmdct_mode': 'wmdct',
     'wmdct_block_size': 'v, px',
-    'wmdct_scale': 'sk'
+    'wmdct_scale': 'sk',
+    'homogeneity_criterion': 'hc',
+    'tile_size': 'tile, px'
 }
 
 METRICS_NAMES = {
@@ -0,0 +1,298 @@
+import base64
+import hashlib
+import http.client
+import json
+import os
+import socket
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import Lock, Thread
+
+from PIL import Image
+
+from qtar.core.container import Key
+from qtar.core.imageqt import QtKeyError
+from qtar.core.params import get_qtar_params, validate_params, WrongQTARParamError
+from qtar.core.qtar import QtarStego, StegoEmbedResult, NoSpaceError, DEFAULT_PARAMS
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# count of prepared containers kept in memory between requests
+PREPARED_CACHE_SIZE = 16
+
+
+class QtarService:
+    """
+    Embedding, extraction and capacity of containers run by pool of worker threads.
+    Prepared containers are kept between requests, so embedding into the same container again only writes the secret.
+    Requests and responses are dicts of JSON, images and keys in them are base64 of their bytes.
+    """
+    def __init__(self, workers=None, cache_size=PREPARED_CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(workers)
+        self.cache_size = cache_size
+        self.prepared = OrderedDict()
+        self.prepared_lock = Lock()
+
+    def run(self, operation, request):
+        if not isinstance(request, dict):
+            raise WrongRequestError('Request must be JSON object')
+        return self.executor.submit(operation, request).result()
+
+    def embed(self, request):
+        prepared = self.prepare(request)
+        img_watermark = decode_image(request, 'secret')
+        resize_to_fit = request.get('resize_to_fit', True)
+        if not isinstance(resize_to_fit, bool):
+            raise WrongRequestError('resize_to_fit must be boolean')
+        result = prepared.embed(img_watermark, resize_to_fit)
+        return {
+            'stego': encode_image(result.img_stego),
+            'key': encode_bytes(result.key.to_bytes()),
+            'bpp': result.bpp
+        }
+
+    def extract(self, request):
+        img_stego = decode_image(request, 'stego')
+        try:
+            key = Key.from_bytes(decode_bytes(request, 'key'))
+        except (struct.error, ValueError, QtKeyError) as e:
+            raise WrongRequestError('Wrong key: %s' % e)
+        return {'secret': encode_image(QtarStego.extract(img_stego, key))}
+
+    def capacity(self, request):
+        prepared = self.prepare(request)
+        return {
+            'available_space': prepared.available_space,
+            'available_bpp': prepared.available_bpp
+        }
+
+    def prepare(self, request):
+        container_bytes = decode_bytes(request, 'container')
+        params = request.get('params') or {}
+        if not isinstance(params, dict):
+            raise WrongRequestError('params must be JSON object')
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise WrongRequestError('Unknown params: ' + ', '.join(sorted(unknown)))
+        try:
+            params = get_qtar_params(validate_params(params))
+        except (WrongQTARParamError, TypeError, ValueError) as e:
+            raise WrongRequestError('Wrong params: %s' % e)
+
+        digest = hashlib.sha1(container_bytes + json.dumps(params, sort_keys=True).encode()).hexdigest()
+        with self.prepared_lock:
+            prepared = self.prepared.get(digest)
+            if prepared is not None:
+                self.prepared.move_to_end(digest)
+                return prepared
+
+        prepared = QtarStego(**params).prepare(read_image(container_bytes, 'container'))
+        with self.prepared_lock:
+            self.prepared[digest] = prepared
+            while len(self.prepared) > self.cache_size:
+                self.prepared.popitem(last=False)
+        return prepared
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class QtarRequestHandler(BaseHTTPRequestHandler):
+    """POST /embed, /extract and /capacity with JSON body, errors are answered with JSON of error message."""
+    operations = ('embed', 'extract', 'capacity')
+
+    def do_POST(self):
+        operation = self.path.strip('/')
+        if operation not in self.operations:
+            return self.send_json(404, {'error': 'Unknown operation: %s' % operation})
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            # JSONDecodeError and wrong Content-Length
+            return self.send_json(400, {'error': 'Wrong request body: %s' % e})
+
+        try:
+            response = self.server.service.run(getattr(self.server.service, operation), request)
+        except WrongRequestError as e:
+            return self.send_json(400, {'error': str(e)})
+        except NoSpaceError as e:
+            return self.send_json(422, {'error': str(e)})
+        except Exception as e:
+            return self.send_json(500, {'error': str(e)})
+        self.send_json(200, response)
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients of unix socket have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class QtarHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        self.service = service
+        self.quiet = quiet
+        super().__init__(address, QtarRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.service.close()
+
+
+class QtarUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service, quiet=False):
+        self.service = service
+        self.quiet = quiet
+        super().__init__(path, QtarRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.service.close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, workers=None,
+                cache_size=PREPARED_CACHE_SIZE, quiet=False):
+    """HTTP server of QtarService on local host and port or on unix socket if its path is given."""
+    service = QtarService(workers, cache_size)
+    if socket_path:
+        return QtarUnixHTTPServer(socket_path, service, quiet)
+    return QtarHTTPServer((host, port), service, quiet)
+
+
+def start_server(server):
+    """Serves in daemon thread, server.shutdown() stops it."""
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+class QtarClient:
+    """Client of qtar server, images are PIL images and keys are Key."""
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def embed(self, img_container, img_watermark, resize_to_fit=True, **params):
+        response = self.request('embed', {
+            'container': encode_image(img_container),
+            'secret': encode_image(img_watermark),
+            'resize_to_fit': resize_to_fit,
+            'params': params
+        })
+        img_stego = open_image(decode_bytes(response, 'stego'))
+        key = Key.from_bytes(decode_bytes(response, 'key'))
+        return StegoEmbedResult(img_stego, key, response['bpp'])
+
+    def extract(self, img_stego, key):
+        response = self.request('extract', {
+            'stego': encode_image(img_stego),
+            'key': encode_bytes(key.to_bytes())
+        })
+        return open_image(decode_bytes(response, 'secret'))
+
+    def capacity(self, img_container, **params):
+        return self.request('capacity', {'container': encode_image(img_container), 'params': params})
+
+    def request(self, operation, request):
+        connection = self.connect()
+        try:
+            body = json.dumps(request).encode()
+            connection.request('POST', '/' + operation, body, {'Content-Type': 'application/json'})
+            http_response = connection.getresponse()
+            response = json.loads(http_response.read())
+        finally:
+            connection.close()
+
+        if http_response.status != 200:
+            raise QtarServerError(http_response.status, response.get('error'))
+        return response
+
+    def connect(self):
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def encode_image(image):
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return encode_bytes(buffer.getvalue())
+
+
+def decode_image(request, name):
+    return read_image(decode_bytes(request, name), name)
+
+
+def read_image(image_bytes, name):
+    try:
+        return open_image(image_bytes)
+    except OSError as e:
+        raise WrongRequestError('Wrong image %s: %s' % (name, e))
+
+
+def open_image(image_bytes):
+    image = Image.open(BytesIO(image_bytes))
+    image.load()
+    return image
+
+
+def encode_bytes(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def decode_bytes(request, name):
+    if name not in request:
+        raise WrongRequestError('%s is required' % name)
+    if not isinstance(request[name], str):
+        raise WrongRequestError('%s must be base64 string' % name)
+    try:
+        return base64.b64decode(request[name], validate=True)
+    except ValueError as e:
+        raise WrongRequestError('Wrong base64 of %s: %s' % (name, e))
+
+
+class WrongRequestError(Exception):
+    pass
+
+
+class QtarServerError(Exception):
+    def __init__(self, status, message):
+        super().__init__('%d: %s' % (status, message))
+        self.status = status
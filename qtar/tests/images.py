@@ -0,0 +1,14 @@
+import numpy as np
+from PIL import Image
+
+
+def random_image(seed, size, mode='RGB'):
+    """Square image of random noise."""
+    rng = np.random.RandomState(seed)
+    shape = (size, size, len(mode)) if len(mode) > 1 else (size, size)
+    return Image.fromarray(rng.randint(0, 256, shape).astype(np.uint8), mode)
+
+
+def smooth_image(seed, size=64):
+    """Square container smooth enough for every mode to find space in it."""
+    return random_image(seed, 8).resize((size, size), Image.BILINEAR)
@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+import numpy as np
+
+from qtar.core.adaptiveregions import adapt_regions, RegionShapeError
+from qtar.core.matrixregion import MatrixRegions
+from qtar.core.quantizationmatrix import generate_quantization_matrix
+
+
+def find_ar_index(region, q_power):
+    size = region.shape[0]
+    quantized = np.uint8(region / (generate_quantization_matrix(size) * q_power))
+    if quantized[-1, -1] != 0:
+        return size
+    for xy in range(0, size):
+        if not quantized[xy:size][xy:size].any():
+            return xy
+
+
+class TestAdaptiveRegions(TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.rects = [(0, 0, 16, 16), (16, 0, 32, 16), (0, 16, 8, 24), (8, 16, 16, 24), (16, 16, 20, 20)]
+        decay = np.exp(-np.add.outer(np.arange(32), np.arange(32)) / 4)
+        self.mx = random.rand(32, 32) * 400 * decay
+        self.mx[15, 31] = 300
+
+    def test_ar_indexes(self):
+        regions = MatrixRegions(self.rects, self.mx)
+
+        ar_regions, ar_indexes = adapt_regions(regions, q_power=1)
+
+        self.assertEqual(ar_indexes, [find_ar_index(region, 1) for region in regions])
+        self.assertEqual(ar_indexes[1], 16)
+        self.assertEqual(ar_regions.rects[0], [ar_indexes[0], ar_indexes[0], 16, 16])
+
+    def test_not_square(self):
+        with self.assertRaises(RegionShapeError):
+            adapt_regions(MatrixRegions([(0, 0, 8, 4)], self.mx), q_power=1)
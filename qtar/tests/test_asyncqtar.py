@@ -0,0 +1,116 @@
+import asyncio
+from threading import Event, Lock
+from unittest import IsolatedAsyncioTestCase
+
+import numpy as np
+
+from qtar.core.asyncqtar import AsyncQtarStego
+from qtar.core.qtar import QtarStego, NoSpaceError
+from qtar.tests.images import random_image, smooth_image
+
+
+class CountingQtarStego(QtarStego):
+    """Counts jobs running at once, preparing waits for release if it is set."""
+    def __init__(self, release=None, **params):
+        super().__init__(**params)
+        self.release = release
+        self.lock = Lock()
+        self.running = 0
+        self.max_running = 0
+        self.embedded = 0
+
+    def prepare(self, img_container, cache=None):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        if self.release is not None:
+            self.release.wait()
+        try:
+            return super().prepare(img_container, cache)
+        except NoSpaceError:
+            with self.lock:
+                self.running -= 1
+            raise
+
+    def embed_prepared(self, prepared, img_watermark, resize_to_fit=True, stages=False):
+        try:
+            return super().embed_prepared(prepared, img_watermark, resize_to_fit, stages)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.embedded += 1
+
+
+class StagedQtarStego(QtarStego):
+    """Counts stages of extraction, restoring waits for release."""
+    release = Event()
+    restoring = 0
+    extracted = 0
+
+    @classmethod
+    def restore(cls, img_stego, key, workers=None):
+        cls.restoring += 1
+        cls.release.wait()
+        return super().restore(img_stego, key, workers)
+
+    @classmethod
+    def extract_restored(cls, restored, key, stages=False, plan=None, workers=None):
+        cls.extracted += 1
+        return super().extract_restored(restored, key, stages, plan, workers)
+
+
+class TestAsyncQtarStego(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.container = smooth_image(0)
+        self.watermark = random_image(1, 16)
+
+    async def test_embed_extract(self):
+        async with AsyncQtarStego(QtarStego(pm_mode=True), workers=2) as qtar:
+            result = await qtar.embed(self.container, self.watermark)
+            extracted = await qtar.extract(result.img_stego, result.key)
+
+        expected = QtarStego(pm_mode=True).embed(self.container, self.watermark)
+        np.testing.assert_array_equal(np.array(result.img_stego), np.array(expected.img_stego))
+        np.testing.assert_array_equal(np.array(extracted), np.array(QtarStego.extract(result.img_stego, result.key)))
+
+    async def test_embed_many(self):
+        counting = CountingQtarStego(cf_mode=True)
+        # curve fitting finds no space in noise
+        pairs = [(self.container, self.watermark), (random_image(2, 64), self.watermark)] * 3
+        async with AsyncQtarStego(counting, workers=4, max_in_flight=2) as qtar:
+            results = await qtar.embed_many(pairs)
+
+        self.assertEqual(len(results), len(pairs))
+        self.assertLessEqual(counting.max_running, 2)
+        for i, result in enumerate(results):
+            if i % 2:
+                self.assertIsInstance(result, NoSpaceError)
+            else:
+                np.testing.assert_array_equal(np.array(result.img_stego), np.array(results[0].img_stego))
+
+    async def test_cancel(self):
+        release = Event()
+        counting = CountingQtarStego(release)
+        async with AsyncQtarStego(counting) as qtar:
+            task = asyncio.ensure_future(qtar.embed(self.container, self.watermark))
+            while counting.running == 0:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.assertEqual(counting.embedded, 0)
+
+    async def test_cancel_extract(self):
+        result = QtarStego().embed(self.container, self.watermark)
+        async with AsyncQtarStego(StagedQtarStego()) as qtar:
+            task = asyncio.ensure_future(qtar.extract(result.img_stego, result.key))
+            while StagedQtarStego.restoring == 0:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            StagedQtarStego.release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.assertEqual(StagedQtarStego.extracted, 0)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+import numpy as np
+
+from qtar.core.qtar import QtarStego, NoSpaceError
+from qtar.core.container import Key
+from qtar.core.batch import iter_embed
+from qtar.tests.images import random_image, smooth_image
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.qtar = QtarStego(cf_mode=True)
+        self.pairs = [(smooth_image(seed), random_image(seed + 10, 16))
+                      for seed in range(3)]
+
+    def test_embed_many(self):
+        results = self.qtar.embed_many(self.pairs, workers=2, chunksize=2)
+
+        self.assertEqual(len(results), len(self.pairs))
+        # curve fitting finds no space in the second container
+        self.assertIsInstance(results[1].error, NoSpaceError)
+        for result, (container, watermark) in zip(results[::2], self.pairs[::2]):
+            expected = self.qtar.embed(container, watermark)
+
+            self.assertTrue(result.ok)
+            np.testing.assert_array_equal(result.stego, np.array(expected.img_stego))
+            self.assertEqual(result.key_bytes, expected.key.to_bytes())
+            self.assertEqual(result.bpp, expected.bpp)
+
+    def test_extract_many(self):
+        embedded = [self.qtar.embed(container, watermark) for container, watermark in self.pairs[::2]]
+        items = [(result.img_stego, Key.from_bytes(result.key.to_bytes())) for result in embedded]
+        items.append((embedded[0].img_stego, b''))
+
+        results = QtarStego.extract_many(items, workers=2)
+
+        self.assertEqual(len(results), len(items))
+        self.assertFalse(results[-1].ok)
+        for result, (img_stego, key) in zip(results, items[:-1]):
+            np.testing.assert_array_equal(result.secret, np.array(QtarStego.extract(img_stego, key)))
+
+    def test_iter_embed(self):
+        qtars = [QtarStego(cf_mode=True), QtarStego(pm_mode=True)]
+        container, watermark = self.pairs[0]
+
+        results = iter_embed((qtar, container, watermark) for qtar in qtars)
+
+        for result, qtar in zip(results, qtars):
+            np.testing.assert_array_equal(result.stego, np.array(qtar.embed(container, watermark).img_stego))
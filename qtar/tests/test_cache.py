@@ -0,0 +1,75 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from qtar.core.cache import AnalysisCache, ArraysCache, ChannelAnalysis
+from qtar.core.qtar import QtarStego
+
+
+class TestAnalysisCache(TestCase):
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        self.cache = AnalysisCache(self.dir.name)
+        self.mx = np.random.RandomState(0).randint(0, 256, (16, 16)).astype(np.uint8)
+        self.analysis = ChannelAnalysis([1, 0, 0, 0, 0], [(0, 0, 8, 8), (8, 0, 16, 8), (0, 8, 8, 16), (8, 8, 16, 16)],
+                                        np.random.RandomState(1).rand(16, 16), ar_key=[1, 2, 3, 8])
+
+    def test_store_load(self):
+        digest = self.cache.digest([self.mx], {'min_block_size': 8})
+        self.assertIsNone(self.cache.load(digest))
+
+        self.cache.store(digest, [self.analysis])
+        analysis, = self.cache.load(digest)
+
+        self.assertEqual(analysis.qt_key, [True, False, False, False, False])
+        self.assertEqual(analysis.rects, self.analysis.rects)
+        self.assertEqual(analysis.ar_key, self.analysis.ar_key)
+        self.assertIsNone(analysis.cf_key)
+        np.testing.assert_array_equal(analysis.dct, self.analysis.dct)
+
+    def test_digest(self):
+        digest = self.cache.digest([self.mx], {'min_block_size': 8})
+
+        self.assertEqual(digest, self.cache.digest([np.copy(self.mx)], {'min_block_size': 8}))
+        self.assertNotEqual(digest, self.cache.digest([self.mx], {'min_block_size': 16}))
+        self.assertNotEqual(digest, self.cache.digest([self.mx.T], {'min_block_size': 8}))
+
+    def test_eviction(self):
+        self.cache.store('first', [self.analysis])
+        self.cache.max_size = self.cache.size * 3 // 2
+        os.utime(os.path.join(self.dir.name, 'first'), (0, 0))
+        self.cache.store('second', [self.analysis])
+
+        self.assertIsNone(self.cache.load('first'))
+        self.assertIsNotNone(self.cache.load('second'))
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+
+    def test_embed(self):
+        rng = np.random.RandomState(2)
+        container = Image.fromarray(rng.randint(0, 256, (64, 64, 3)).astype(np.uint8), 'RGB')
+        watermark = Image.fromarray(rng.randint(0, 256, (16, 16, 3)).astype(np.uint8), 'RGB')
+        qtar = QtarStego(pm_mode=True)
+
+        expected = qtar.embed(container, watermark)
+        qtar.embed(container, watermark, cache=self.cache)
+        cached = qtar.embed(container, watermark, cache=self.cache)
+
+        self.assertEqual(len(os.listdir(self.dir.name)), 1)
+        self.assertEqual(cached.key.chs_qt_key, expected.key.chs_qt_key)
+        np.testing.assert_array_equal(np.array(cached.img_stego), np.array(expected.img_stego))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+class TestArraysCache(TestCase):
+    def test_size(self):
+        cache = ArraysCache(100)
+        cache.get('first', lambda: np.zeros(10))
+        cache.get('second', lambda: np.zeros(10))
+
+        self.assertEqual(list(cache.arrays), ['second'])
+        self.assertEqual(cache.size, 80)
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+from contextlib import redirect_stderr
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from qtar.cli.batch import embed_batch, extract_batch, get_embed_batch_argparser, get_extract_batch_argparser, \
+    read_manifest, row_params
+from qtar.cli.qtarargparser import get_qtar_params, validate_params, WrongQTARParamError
+from qtar.tests.images import random_image, smooth_image
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('manifest.csv', 'container,secret,pm_mode,homogeneity_threshold\n'
+                                          'a.png,b.png,true,0.5\n'
+                                          '2024,1e3,,\n')
+
+        self.assertEqual(read_manifest(path), [
+            {'container': 'a.png', 'secret': 'b.png', 'pm_mode': True, 'homogeneity_threshold': 0.5},
+            {'container': '2024', 'secret': '1e3', 'pm_mode': None, 'homogeneity_threshold': None}
+        ])
+
+    def test_json_lines(self):
+        path = self.write('manifest.jsonl', '{"stego": "a.png", "key": "a.key"}\n\n{"stego": "b.png"}\n')
+
+        self.assertEqual(read_manifest(path), [{'stego': 'a.png', 'key': 'a.key'}, {'stego': 'b.png'}])
+
+    def test_row_params(self):
+        params = get_qtar_params(validate_params({}))
+
+        overridden = row_params(params, {'container': 'a.png', 'pm_mode': True, 'quant_power': None})
+
+        self.assertEqual(overridden, dict(params, pm_mode=True))
+        with self.assertRaises(WrongQTARParamError):
+            row_params(params, {'homogeneity_criterion': 'unknown'})
+
+
+class TestBatchCommands(TestCase):
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        for i in range(3):
+            smooth_image(i).save(os.path.join(self.dir.name, 'container%d.png' % i))
+            random_image(i + 10, 16).save(os.path.join(self.dir.name, 'secret%d.png' % i))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def run_command(self, command, argparser, args):
+        params = vars(argparser.parse_args(args + ['-P', '1']))
+        threads = threading.active_count()
+        with redirect_stderr(StringIO()):
+            stats = command(params)
+        # reader and writer threads are finished when the command returns
+        self.assertEqual(threading.active_count(), threads)
+        return stats
+
+    def test_embed_extract(self):
+        with open(self.path('embed.csv'), 'w') as file:
+            file.write('container,secret,stego,key,pm_mode\n'
+                       'container0.png,secret0.png,out/stego0.png,out/0.key,\n'
+                       'container1.png,missing.png,out/stego1.png,out/1.key,\n'
+                       'container2.png,secret2.png,out/stego2.png,out/2.key,true\n')
+
+        stats = self.run_command(lambda params: embed_batch(validate_params(params)), get_embed_batch_argparser(),
+                                 [self.path('embed.csv')])
+
+        self.assertEqual((stats.succeeded, stats.failed), (2, 1))
+        self.assertTrue(os.path.exists(self.path('out/stego2.png')))
+        self.assertFalse(os.path.exists(self.path('out/stego1.png')))
+
+        with open(self.path('extract.jsonl'), 'w') as file:
+            for row in ({'stego': 'out/stego0.png', 'key': 'out/0.key', 'output': 'secret0_out.png'},
+                        {'stego': 'out/stego2.png', 'output': 'secret2_out.png'},
+                        {'stego': 'out/stego2.png', 'key': 'out/2.key', 'output': 'secret2_out.png'}):
+                file.write(json.dumps(row) + '\n')
+
+        stats = self.run_command(extract_batch, get_extract_batch_argparser(), [self.path('extract.jsonl')])
+
+        self.assertEqual((stats.succeeded, stats.failed), (2, 1))
+        self.assertTrue(os.path.exists(self.path('secret0_out.png')))
+        self.assertTrue(os.path.exists(self.path('secret2_out.png')))
+
+    def test_missing_column(self):
+        with open(self.path('embed.jsonl'), 'w') as file:
+            file.write(json.dumps({'container': 'container0.png', 'secret': 'secret0.png', 'key': '0.key'}) + '\n')
+
+        stats = self.run_command(lambda params: embed_batch(validate_params(params)), get_embed_batch_argparser(),
+                                 [self.path('embed.jsonl')])
+
+        self.assertEqual((stats.succeeded, stats.failed), (0, 1))
+        self.assertFalse(os.path.exists(self.path('0.key')))
@@ -1,8 +1,9 @@
 from unittest import TestCase
 
+import numpy as np
 from PIL import Image
 
-from qtar.core.container import Key
+from qtar.core.container import Key, TILED_FLAG
 from qtar.core.qtar import QtarStego
 
 
@@ -10,6 +11,10 @@ TESTING_CONTAINER_PATH = "images/Lenna.png"
 TESTING_WATERMARK_PATH = "images/Garold.png"
 TESTING_KEY_PATH = "test_key.qtarkey"
 
+# keys saved before tiling was added: plain adaptive regions and curve fitting
+BASELINE_AR_KEY = '0000000000c03f0200000003000000100000001000000001010000008003000701'
+BASELINE_CF_KEY = '0001000000003f0000000000000000100000001000000001080000000100000080010203040506070808010101'
+
 
 class TestKey(TestCase):
     def setUp(self):
@@ -33,3 +38,37 @@ class TestKey(TestCase):
     def tearDown(self):
         self.container.close()
         self.watermark.close()
+
+
+class TestKeyBytes(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.container = Image.fromarray(rng.randint(0, 256, (8, 8, 3)).astype(np.uint8)).resize((64, 64),
+                                                                                                 Image.BILINEAR)
+        self.watermark = Image.fromarray(rng.randint(0, 256, (16, 16, 3)).astype(np.uint8))
+
+    def test_bytes(self):
+        for params in ({'pm_mode': True}, {'cf_mode': True}, {'wmdct_mode': True, 'tile_size': 32}):
+            key = QtarStego(**params).embed(self.container, self.watermark).key
+            opened_key = Key.from_bytes(key.to_bytes())
+
+            self.assertEqual(opened_key.to_bytes(), key.to_bytes(), str(params))
+            self.assertEqual(opened_key.chs_qt_key, key.chs_qt_key, str(params))
+
+    def test_baseline_format(self):
+        ar_key = Key.from_bytes(bytes.fromhex(BASELINE_AR_KEY))
+        cf_key = Key.from_bytes(bytes.fromhex(BASELINE_CF_KEY))
+
+        self.assertEqual((ar_key.offset, ar_key.wm_shape, ar_key.ch_scale), ((2, 3), (16, 16), 1.5))
+        self.assertEqual(ar_key.chs_ar_key, [[3, 0, 7, 1]])
+        self.assertFalse(ar_key.tiled or ar_key.pm_mode or ar_key.cf_mode or ar_key.wmdct_mode)
+        self.assertEqual(cf_key.chs_cf_key, [[(1, 2, 3), (4, 5, 6), (7, 8, 8), (1, 1, 1)]])
+        self.assertEqual(cf_key.cf_grid_size, 8)
+        self.assertEqual(ar_key.to_bytes().hex(), BASELINE_AR_KEY)
+        self.assertEqual(cf_key.to_bytes().hex(), BASELINE_CF_KEY)
+
+    def test_tiled_flag(self):
+        key = QtarStego(tile_size=32).embed(self.container, self.watermark).key
+
+        self.assertEqual(key.to_bytes()[0], TILED_FLAG)
+        self.assertTrue(Key.from_bytes(key.to_bytes()).tiled)
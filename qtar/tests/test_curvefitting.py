@@ -4,10 +4,42 @@ import numpy as np
 
 np.set_printoptions(threshold=np.inf)
 
-from qtar.core.curvefitting import CFRegions
+from qtar.core.curvefitting import CFRegions, curve_func, cf_mask, cf_positions
 
 SIZE = 32
 
+
+class TestCFGeometry(TestCase):
+    def setUp(self):
+        self.mx = np.arange(SIZE ** 2).reshape((SIZE, SIZE))
+        self.rects = [(0, 0, SIZE, SIZE), (0, 0, SIZE // 2, SIZE)]
+        self.curves = [(3, 2, 3), (5, 1, 2)]
+
+    def test_get_cfregion(self):
+        cfr = CFRegions(self.rects, self.mx, self.curves)
+
+        for i, (rect, curve) in enumerate(zip(self.rects, self.curves)):
+            region = cfr.get_region(rect)
+            normal_curve = [coord * 8 for coord in curve]
+            columns = [column[int(np.ceil(curve_func(normal_curve, x))):] for x, column in enumerate(region.T)]
+
+            np.testing.assert_array_equal(cfr[i], np.concatenate(columns))
+            self.assertEqual(cfr.get_cfregion_size(i), sum(column.size for column in columns))
+
+        self.assertEqual(cfr.total_size, cfr[0].size + cfr[1].size)
+
+    def test_set_cfregion(self):
+        cfr = CFRegions(self.rects, self.mx.copy(), self.curves)
+
+        cfr[0] = -np.arange(cfr.get_cfregion_size(0))
+
+        np.testing.assert_array_equal(cfr[0], -np.arange(cfr.get_cfregion_size(0)))
+        above_curve = ~cf_mask((SIZE, SIZE), self.curves[0], 8)
+        np.testing.assert_array_equal(cfr.matrix[above_curve], self.mx[above_curve])
+
+    def test_positions_cached(self):
+        self.assertIs(cf_positions((SIZE, SIZE), (3, 2, 3), 8), cf_positions((SIZE, SIZE), (3, 2, 3), 8))
+
 # TODO: fix test
 
 # class TestCFRegion(TestCase):
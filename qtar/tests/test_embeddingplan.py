@@ -0,0 +1,103 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from qtar.core.container import Key
+from qtar.core.curvefitting import CFRegions
+from qtar.core.embeddingplan import EmbeddingPlan, get_plan, plans_cache
+from qtar.core.imageqt import QtKeyError
+from qtar.core.matrixregion import MatrixRegions, divide_into_equal_regions
+from qtar.core.zigzag import zigzag_embed_to_regions, zigzag_embed_to_cfregions, zigzag_extract_from_regions
+
+
+class TestEmbeddingPlan(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        rects = [(0, 0, 8, 8), (8, 0, 16, 8), (0, 8, 8, 16), (8, 8, 12, 12), (12, 8, 16, 12), (8, 12, 12, 16),
+                 (12, 12, 16, 16)]
+        ar_rects = [(x0 + 2, y0 + 2, x1, y1) for x0, y0, x1, y1 in rects]
+        self.container = rng.rand(16, 16)
+        self.regions = MatrixRegions(ar_rects, self.container)
+        self.cf_regions = CFRegions(rects, self.container, [(1, 1, 1), (2, 1, 2), (0, 0, 0), (1, 1, 1),
+                                                           (0, 1, 1), (2, 2, 2), (1, 0, 1)], 2)
+        self.secret = rng.rand(8, 6)
+
+    def test_flat(self):
+        plan = EmbeddingPlan.build([self.regions], Key(wm_shape=(6, 8)))
+        embedded = plan.embed(0, np.copy(self.container), self.secret)
+        expected = np.concatenate([region.ravel() for region in MatrixRegions(self.regions.rects, embedded)])
+
+        assert_array_equal(expected[:self.secret.size], self.secret.ravel())
+        assert_array_equal(plan.extract(0, embedded).reshape(plan.secret_shape), self.secret)
+
+    def test_zigzag(self):
+        key = Key(wm_shape=(6, 8), wmdct_mode=True, wmdct_block_size=4)
+        plan = EmbeddingPlan.build([self.regions], key)
+        wm_regions = divide_into_equal_regions(self.secret, 4)
+
+        embedded = plan.embed(0, np.copy(self.container), self.secret)
+        expected = zigzag_embed_to_regions(wm_regions, MatrixRegions(self.regions.rects, np.copy(self.container)))
+
+        assert_array_equal(embedded, expected.matrix)
+        assert_array_equal(plan.extract(0, embedded).reshape(plan.secret_shape),
+                           zigzag_extract_from_regions(MatrixRegions(self.regions.rects, embedded), (8, 6), 4).matrix)
+
+    def test_cf_zigzag(self):
+        key = Key(wm_shape=(6, 8), wmdct_mode=True, wmdct_block_size=4)
+        plan = EmbeddingPlan.build([self.cf_regions], key)
+        wm_regions = divide_into_equal_regions(self.secret, 4)
+
+        embedded = plan.embed(0, np.copy(self.container), self.secret)
+        cf_regions = CFRegions(self.cf_regions.rects, np.copy(self.container), self.cf_regions.curves, 2)
+        expected = zigzag_embed_to_cfregions(wm_regions, cf_regions)
+
+        assert_array_equal(embedded, expected.matrix)
+
+    def test_over_capacity(self):
+        plan = EmbeddingPlan.build([self.regions], Key(wm_shape=(20, 20)))
+
+        self.assertFalse(plan.fits(0))
+        self.assertEqual((plan.chs_indexes[0] >= 0).sum(), self.regions.total_size)
+
+    def test_save_open(self):
+        plan = EmbeddingPlan.build([self.regions, self.cf_regions], Key(wm_shape=(6, 8)))
+        with TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'plan.qtarplan')
+            plan.save(path)
+            opened = EmbeddingPlan.open(path)
+
+        self.assertEqual(opened.wm_shape, plan.wm_shape)
+        for indexes, opened_indexes in zip(plan.chs_indexes, opened.chs_indexes):
+            assert_array_equal(opened_indexes, indexes)
+
+    def test_get_plan(self):
+        key = Key(chs_qt_key=[[0]], chs_ar_key=[[2] * 7], wm_shape=(6, 8))
+
+        plan = get_plan([self.regions], key)
+
+        self.assertIs(get_plan([self.regions], key), plan)
+        self.assertGreaterEqual(plans_cache.size, plan.nbytes)
+        self.assertFalse(plan.chs_indexes[0].flags.writeable)
+
+    def test_validate(self):
+        key = Key(chs_qt_key=[[0]], chs_ar_key=[[2] * 7], wm_shape=(6, 8))
+        plan = EmbeddingPlan.build([self.regions], key)
+        with TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'plan.qtarplan')
+            plan.save(path)
+
+            with self.assertRaises(QtKeyError):
+                EmbeddingPlan.open(path, Key(chs_qt_key=[[0]], chs_ar_key=[[2] * 7], wm_shape=(8, 6)))
+            with self.assertRaises(QtKeyError):
+                EmbeddingPlan.open(path, Key(chs_qt_key=[[0]] * 3, chs_ar_key=[[2] * 7] * 3, wm_shape=(6, 8)))
+            # the same size of secret and channels, but other adaptive regions
+            with self.assertRaises(QtKeyError):
+                EmbeddingPlan.open(path, Key(chs_qt_key=[[0]], chs_ar_key=[[3] * 7], wm_shape=(6, 8)))
+            opened = EmbeddingPlan.open(path, key)
+
+        opened.validate(key, self.container.shape)
+        with self.assertRaises(QtKeyError):
+            opened.validate(key, (self.container.shape[0] * 2, self.container.shape[1]))
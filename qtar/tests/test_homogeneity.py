@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+import numpy as np
+
+from qtar.core.homogeneity import IntegralImage, homogeneous, STD, VARIANCE
+from qtar.core.imageqt import ImageQT, QtNode
+
+
+class TestIntegralImage(TestCase):
+    def setUp(self):
+        self.mx = np.random.RandomState(0).randint(0, 256, (16, 16)).astype(np.uint8)
+        self.integral = IntegralImage(self.mx)
+
+    def test_rect_sums(self):
+        region = self.mx[3:11, 2:7].astype(np.int64)
+        sums, sq_sums = self.integral.rect_sums((2, 3, 7, 11))
+
+        self.assertEqual(sums, region.sum())
+        self.assertEqual(sq_sums, (region ** 2).sum())
+
+    def test_blocks_sums(self):
+        sums, sq_sums = self.integral.blocks_sums(4)
+        blocks = self.mx.reshape((4, 4, 4, 4)).astype(np.int64)
+
+        np.testing.assert_array_equal(sums, blocks.sum(axis=(1, 3)))
+        np.testing.assert_array_equal(sq_sums, (blocks ** 2).sum(axis=(1, 3)))
+
+
+class TestCriteria(TestCase):
+    def setUp(self):
+        self.blocks = np.array([
+            [[10, 10], [10, 10]],
+            [[0, 40], [0, 40]],
+            [[200, 210], [220, 230]]
+        ]).astype(np.int64)
+        self.sums = self.blocks.sum(axis=(1, 2))
+        self.sq_sums = (self.blocks ** 2).sum(axis=(1, 2))
+
+    def test_std(self):
+        result = homogeneous(0.1, STD, 4, self.sums, self.sq_sums)
+        np.testing.assert_array_equal(result, self.blocks.std(axis=(1, 2)) < 0.1 * 128)
+
+    def test_variance(self):
+        result = homogeneous([0.01, 0.02], VARIANCE, 4, self.sums, self.sq_sums)
+        np.testing.assert_array_equal(result, self.blocks.var(axis=(1, 2)) < np.array([0.01, 0.01, 0.02]) * 128 ** 2)
+
+
+class TestImageQTCriteria(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        gradient = np.add.outer(np.arange(64), np.arange(64)) * 2
+        noise = rng.randint(0, 256, (64, 64))
+        self.mx = np.where(rng.rand(64, 64) < 0.02, noise, gradient).astype(np.uint8)
+
+    def assert_same_tree(self, criterion, threshold):
+        qt = ImageQT(self.mx, 4, 32, threshold, criterion=criterion)
+        recursive_qt = ImageQT(self.mx, 4, 32, threshold, criterion=criterion)
+        recursive_qt.key = []
+        recursive_qt.build_tree(QtNode(None, (0, 0, 64, 64)))
+
+        self.assertEqual(qt.key, recursive_qt.key, "wrong key generation")
+        self.assertGreater(len(qt.rects), 1)
+
+    def test_std(self):
+        self.assert_same_tree(STD, 0.05)
+
+    def test_variance(self):
+        self.assert_same_tree(VARIANCE, [0.001, 0.005])
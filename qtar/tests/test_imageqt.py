@@ -2,7 +2,7 @@ from unittest import TestCase
 
 import numpy as np
 
-from qtar.core.imageqt import ImageQT, ImageQTPM
+from qtar.core.imageqt import ImageQT, ImageQTPM, ImageQTForest, QtNode, QtTree, parse_qt_key
 
 
 class TestImageQT(TestCase):
@@ -15,6 +15,7 @@ class TestImageQT(TestCase):
             [128, 13, 14, 15]
         ])
 
+        self.mx = mx
         self.qt = ImageQT(mx, 1, 4, 0.5)
 
     def test_rects(self):
@@ -67,6 +68,108 @@ class TestImageQT(TestCase):
                ]
         self.assertEqual(self.qt.key, key, "wrong key generation")
 
+    def test_from_key(self):
+        qt = ImageQT(self.mx, key=self.qt.key)
+
+        self.assertEqual(qt.rects, self.qt.rects, "wrong blocks dividing")
+        self.assertEqual(qt.max_depth, self.qt.max_depth, "wrong depth calculation")
+
+
+class TestQtTree(TestCase):
+    def setUp(self):
+        key = [1, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0]
+        self.tree = QtTree.from_key(key, 4)
+
+    def test_parents(self):
+        self.assertEqual(self.tree.parent.tolist(), [-1, 0, 1, 1, 1, 1, 0, 0, 7, 7, 7, 7, 0])
+
+    def test_nodes(self):
+        nodes = self.tree.nodes()
+        root = nodes[0]
+
+        self.assertEqual([node.rect for node in root.children], [(0, 0, 2, 2), (2, 0, 4, 2), (0, 2, 2, 4), (2, 2, 4, 4)])
+        self.assertEqual([node.type for node in root.children],
+                         [QtNode.BRANCH, QtNode.LEAF, QtNode.BRANCH, QtNode.LEAF])
+        self.assertEqual([node.depth for node in nodes], self.tree.depth.tolist())
+
+    def test_nodes_built_once(self):
+        self.assertIs(self.tree.nodes(), self.tree.nodes())
+        self.assertIs(self.tree.leaves(), self.tree.leaves())
+        self.assertEqual([node.rect for node in self.tree.leaves()], self.tree.rects)
+
+
+class TestParseQtKey(TestCase):
+    def test_padding(self):
+        key = [1, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0]
+        padded_key = np.array(key + [0, 1, 1], bool)
+
+        self.assertEqual(parse_qt_key(padded_key), ([bool(bit) for bit in key], 10))
+
+    def test_deep_key(self):
+        key = [True] + [True, False, False, False] * 5000 + [False] * 4
+
+        self.assertEqual(parse_qt_key(key), (key, 15004))
+
+    def test_forest_key(self):
+        key = [1, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0]
+        forest_key = key + [0] + key + [0, 1]
+
+        self.assertEqual(parse_qt_key(forest_key, 3), ([bool(bit) for bit in key + [0] + key], 21))
+
+
+class TestImageQTForest(TestCase):
+    def setUp(self):
+        self.mx = np.random.RandomState(0).randint(0, 256, (10, 13))
+        self.forest = ImageQTForest(self.mx, 4, 1, 4, 0.3)
+
+    def test_rects(self):
+        tile = ImageQT(self.mx[4:8, 8:12], 1, 4, 0.3)
+        tile_rects = [(x0 + 8, y0 + 4, x1 + 8, y1 + 4) for x0, y0, x1, y1 in tile.rects]
+
+        self.assertEqual(self.forest.tiles_shape, (3, 2))
+        self.assertEqual(self.forest.tiled_shape, (8, 12))
+        self.assertEqual(self.forest.rects[-len(tile_rects):], tile_rects)
+
+    def test_from_key(self):
+        forest = ImageQTForest(self.mx, 4, key=self.forest.key + [1, 0])
+
+        self.assertEqual(forest.rects, self.forest.rects)
+
+    def test_permutation(self):
+        forest = ImageQTForest(np.copy(self.mx), 4, 1, 4, 0.3, pm_mode=True)
+        restored = ImageQTForest(self.mx, 4, key=forest.key, pm_mode=True, permutation=forest.permutation)
+
+        self.assertTrue(np.array_equal(restored.matrix, forest.matrix))
+        self.assertEqual(sorted(forest.permutation.ravel().tolist()), list(range(self.mx.size)))
+
+
+class TestImageQTPyramid(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        gradient = np.add.outer(np.arange(64), np.arange(64)) * 2
+        noise = rng.randint(0, 256, (64, 64))
+        self.mx = np.where(rng.rand(64, 64) < 0.02, noise, gradient).astype(np.uint8)
+
+    def build_recursive(self, threshold):
+        qt = ImageQT(self.mx, 4, 32, threshold)
+        qt.key = []
+        qt.build_tree(QtNode(None, (0, 0, 64, 64)))
+        return ImageQT(self.mx, key=qt.key)
+
+    def assert_same_tree(self, threshold):
+        qt = ImageQT(self.mx, 4, 32, threshold)
+        recursive_qt = self.build_recursive(threshold)
+
+        self.assertEqual(qt.key, recursive_qt.key, "wrong key generation")
+        self.assertEqual(qt.rects, recursive_qt.rects, "wrong blocks dividing")
+        self.assertEqual(qt.max_depth, recursive_qt.max_depth, "wrong depth calculation")
+
+    def test_threshold(self):
+        self.assert_same_tree(0.3)
+
+    def test_brightness_thresholds(self):
+        self.assert_same_tree([0.1, 0.3, 0.6])
+
 
 class TestImageQTPM(TestCase):
     def setUp(self):
@@ -76,6 +179,7 @@ class TestImageQTPM(TestCase):
             [0, 9, 127, 0],
             [128, 13, 14, 128]
         ])
+        self.mx = np.copy(mx)
         self.qt = ImageQTPM(mx, 1, 4, 0.5)
 
     def test_rects(self):
@@ -134,4 +238,34 @@ class TestImageQTPM(TestCase):
             [13, 14, 15, 5]
         ]
 
-        self.assertEqual(self.qt.permutation.tolist(), permutation, "wrong permutation generation")
\ No newline at end of file
+        self.assertEqual(self.qt.permutation.tolist(), permutation, "wrong permutation generation")
+
+    def test_from_key(self):
+        qt = ImageQTPM(np.copy(self.mx), key=self.qt.key)
+
+        self.assertEqual(qt.rects, self.qt.rects, "wrong blocks dividing")
+        np.testing.assert_array_equal(qt.permutation, self.qt.permutation)
+
+
+class TestImageQTPMLevels(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        gradient = np.add.outer(np.arange(64), np.arange(64)) * 2
+        noise = rng.randint(0, 256, (64, 64))
+        self.mx = np.where(rng.rand(64, 64) < 0.05, noise, gradient).astype(np.uint8)
+
+    def build_recursive(self):
+        qt = ImageQTPM(np.copy(self.mx), 4, 32, 0.3)
+        qt.matrix = np.copy(self.mx)
+        qt.permutation = np.arange(self.mx.size).reshape(self.mx.shape)
+        qt.key = []
+        qt.build_tree(QtNode(None, (0, 0, 64, 64)))
+        return qt
+
+    def test_levels(self):
+        qt = ImageQTPM(np.copy(self.mx), 4, 32, 0.3)
+        recursive_qt = self.build_recursive()
+
+        self.assertEqual(qt.key, recursive_qt.key, "wrong key generation")
+        np.testing.assert_array_equal(qt.permutation, recursive_qt.permutation)
+        np.testing.assert_array_equal(qt.matrix, recursive_qt.matrix)
@@ -2,7 +2,7 @@ from unittest import TestCase
 
 import numpy as np
 
-from qtar.core.matrixregion import divide_into_equal_regions
+from qtar.core.matrixregion import divide_into_equal_regions, changed_rects
 
 
 class TestMatrixRegion(TestCase):
@@ -16,3 +16,11 @@ class TestMatrixRegion(TestCase):
         rects = regions.rects
 
         self.assertEqual(rects, [(0, 0, 8, 8), (8, 0, 16, 8), (0, 8, 8, 16), (8, 8, 16, 16)])
+
+    def test_changed_rects(self):
+        mx = np.zeros((16, 16))
+        changed_mx = np.copy(mx)
+        changed_mx[9, 3] = 1
+        rects = divide_into_equal_regions(mx, 8).rects
+
+        self.assertEqual(changed_rects(rects, mx, changed_mx).tolist(), [False, False, True, False])
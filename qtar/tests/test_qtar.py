@@ -0,0 +1,109 @@
+import warnings
+from unittest import TestCase
+
+import numpy as np
+
+from qtar.core.qtar import QtarStego
+from qtar.tests.images import random_image, smooth_image
+
+
+class TestPreparedContainer(TestCase):
+    def setUp(self):
+        self.qtar = QtarStego(pm_mode=True)
+        self.container = random_image(0, 64)
+        self.watermarks = [random_image(1, 16), random_image(2, 16)]
+        self.prepared = self.qtar.prepare(self.container)
+
+    def test_embed(self):
+        for watermark in self.watermarks:
+            expected = self.qtar.embed(self.container, watermark)
+            result = self.prepared.embed(watermark)
+
+            np.testing.assert_array_equal(np.array(result.img_stego), np.array(expected.img_stego))
+            self.assertEqual(result.bpp, expected.bpp)
+
+    def test_keys(self):
+        first, second = (self.prepared.embed(watermark).key for watermark in self.watermarks)
+
+        self.assertEqual(len(first.chs_pm_fix_key), 3)
+        self.assertEqual(len(second.chs_pm_fix_key), 3)
+        self.assertEqual(first.chs_qt_key, second.chs_qt_key)
+
+    def test_available_space(self):
+        result = self.prepared.embed(self.watermarks[0])
+
+        self.assertEqual(result.key.wm_shape, (int(np.sqrt(self.prepared.available_space)),) * 2)
+
+
+class TestExtract(TestCase):
+    def setUp(self):
+        self.container = smooth_image(0)
+        self.watermark = random_image(1, 4)
+
+    def test_small_secret(self):
+        for params in ({}, {'cf_mode': True}, {'wmdct_mode': True, 'wmdct_block_size': 2}):
+            result = QtarStego(**params).embed(self.container, self.watermark, resize_to_fit=False)
+            stego, key = result.img_stego, result.key
+
+            extracted = QtarStego.extract(stego, key)
+            expected = QtarStego.extract(stego, key, stages=True)['9-extracted_watermark']
+
+            np.testing.assert_array_equal(np.array(extracted), np.array(expected), str(params))
+
+
+class TestEmbed(TestCase):
+    def setUp(self):
+        self.container = smooth_image(0)
+
+    def test_capacity_warning(self):
+        for params in ({}, {'cf_mode': True}):
+            prepared = QtarStego(**params).prepare(self.container)
+            size = int(np.sqrt(prepared.available_space))
+
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                prepared.embed(random_image(1, size), resize_to_fit=False)
+                self.assertEqual(len(caught), 0, str(params))
+
+                prepared.embed(random_image(1, size + 1), resize_to_fit=False)
+                self.assertEqual(len(caught), 1, str(params))
+
+
+class TestWorkers(TestCase):
+    def setUp(self):
+        self.container = smooth_image(0)
+        self.watermark = random_image(1, 16)
+
+    def test_embed_extract(self):
+        for params in ({'pm_mode': True}, {'cf_mode': True}, {'wmdct_mode': True, 'wmdct_block_size': 4}):
+            expected = QtarStego(**params).embed(self.container, self.watermark)
+            result = QtarStego(workers=3, **params).embed(self.container, self.watermark)
+
+            np.testing.assert_array_equal(np.array(result.img_stego), np.array(expected.img_stego), str(params))
+            self.assertEqual(repr(result.key.chs_pm_fix_key), repr(expected.key.chs_pm_fix_key), str(params))
+            np.testing.assert_array_equal(np.array(QtarStego.extract(result.img_stego, result.key, workers=3)),
+                                          np.array(QtarStego.extract(result.img_stego, result.key)), str(params))
+
+    def test_tiles(self):
+        for params in ({'tile_size': 16}, {'tile_size': 16, 'pm_mode': True}):
+            expected = QtarStego(**params).embed(self.container, self.watermark)
+            result = QtarStego(workers=3, **params).embed(self.container, self.watermark)
+
+            self.assertEqual(result.key.to_bytes(), expected.key.to_bytes(), str(params))
+            np.testing.assert_array_equal(np.array(result.img_stego), np.array(expected.img_stego), str(params))
+
+
+class TestStages(TestCase):
+    def setUp(self):
+        self.container = smooth_image(0)
+        self.watermark = random_image(1, 16)
+
+    def test_lazy(self):
+        result = QtarStego().embed(self.container, self.watermark, stages=True)
+        stages = result.stages_imgs
+
+        self.assertEqual(len(stages.rendered), 0)
+        self.assertIs(stages['4-dct'], stages['4-dct'])
+        self.assertEqual(list(stages.rendered), ['4-dct'])
+        self.assertEqual(list(stages), ['1-container', '2-quad_tree', '3-adaptive_regions', '4-dct',
+                                        '5-watermark', '6-stego_image'])
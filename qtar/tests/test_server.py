@@ -0,0 +1,100 @@
+import os
+import socket
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+from qtar.core.qtar import QtarStego
+from qtar.server import QtarClient, QtarServerError, make_server, start_server, encode_image, encode_bytes
+from qtar.tests.images import random_image, smooth_image
+
+
+class TestServer(TestCase):
+    def setUp(self):
+        self.server = make_server(port=0, workers=2, quiet=True)
+        start_server(self.server)
+        self.client = QtarClient(*self.server.server_address)
+        self.container = smooth_image(0)
+        self.watermark = random_image(1, 16)
+
+    def test_embed_extract(self):
+        for params in ({}, {'pm_mode': True}, {'cf_mode': True}):
+            expected = QtarStego(**params).embed(self.container, self.watermark)
+            result = self.client.embed(self.container, self.watermark, **params)
+
+            np.testing.assert_array_equal(np.array(result.img_stego), np.array(expected.img_stego), str(params))
+            self.assertEqual(result.key.to_bytes(), expected.key.to_bytes(), str(params))
+            self.assertEqual(result.bpp, expected.bpp, str(params))
+
+            extracted = self.client.extract(result.img_stego, result.key)
+            np.testing.assert_array_equal(np.array(extracted),
+                                          np.array(QtarStego.extract(result.img_stego, result.key)), str(params))
+
+    def test_capacity(self):
+        capacity = self.client.capacity(self.container, pm_mode=True)
+        prepared = QtarStego(pm_mode=True).prepare(self.container)
+
+        self.assertEqual(capacity['available_space'], prepared.available_space)
+        self.assertEqual(len(self.server.service.prepared), 1)
+
+        self.client.embed(self.container, self.watermark, pm_mode=True)
+        self.assertEqual(len(self.server.service.prepared), 1)
+
+    def test_errors(self):
+        with self.assertRaises(QtarServerError) as caught:
+            self.client.capacity(self.container, unknown=1)
+        self.assertEqual(caught.exception.status, 400)
+
+        for params in ({'homogeneity_criterion': 'unknown'}, {'tile_size': 12}, {'quant_power': 'high'}):
+            with self.assertRaises(QtarServerError) as caught:
+                self.client.capacity(self.container, **params)
+            self.assertEqual(caught.exception.status, 400, str(params))
+
+        with self.assertRaises(QtarServerError) as caught:
+            self.client.embed(random_image(2, 64), self.watermark, cf_mode=True)
+        self.assertEqual(caught.exception.status, 422)
+
+        with self.assertRaises(QtarServerError) as caught:
+            self.client.request('extract', {'stego': encode_image(self.container), 'key': encode_bytes(b'key')})
+        self.assertEqual(caught.exception.status, 400)
+
+    def test_malformed_requests(self):
+        container = encode_image(self.container)
+        for operation, request in (('capacity', {'container': 5}),
+                                   ('capacity', [container]),
+                                   ('capacity', {'container': container, 'params': ['pm_mode']}),
+                                   ('embed', {'container': container, 'secret': encode_image(self.watermark),
+                                              'resize_to_fit': 'yes'})):
+            with self.assertRaises(QtarServerError) as caught:
+                self.client.request(operation, request)
+            self.assertEqual(caught.exception.status, 400, str(request)[:40])
+
+        connection = self.client.connect()
+        connection.request('POST', '/capacity', b'{"container": ', {'Content-Type': 'application/json'})
+        self.assertEqual(connection.getresponse().status, 400)
+        connection.close()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX'), 'unix sockets are not supported')
+class TestUnixServer(TestCase):
+    def test_embed(self):
+        container = smooth_image(0)
+        watermark = random_image(1, 16)
+        with TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'qtar.sock')
+            server = make_server(socket_path=path, quiet=True)
+            start_server(server)
+            try:
+                result = QtarClient(socket_path=path).embed(container, watermark)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+            self.assertFalse(os.path.exists(path))
+        np.testing.assert_array_equal(np.array(result.img_stego),
+                                      np.array(QtarStego().embed(container, watermark).img_stego))
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+import numpy as np
+from scipy.fftpack import dct
+
+from qtar.core.matrixregion import MatrixRegions, divide_into_equal_regions
+from qtar.core.transform import dct_regions, idct_regions, size_classes, get_backend, BACKENDS, AUTO, \
+    WrongBackendError
+
+
+class TestDctRegions(TestCase):
+    def setUp(self):
+        self.mx = np.random.RandomState(0).rand(20, 24) * 255
+        self.regions = MatrixRegions([(0, 0, 16, 16), (16, 0, 24, 8), (16, 8, 24, 16),
+                                      (0, 16, 8, 24), (8, 16, 16, 24), (16, 16, 24, 24)], self.mx)
+
+    def test_dct(self):
+        result = dct_regions(self.regions)
+
+        for rect in self.regions.rects:
+            region = self.regions.get_region(rect)
+            expected = dct(dct(region, norm='ortho').T, norm='ortho').T
+            np.testing.assert_array_equal(result.get_region(rect), expected)
+
+    def test_idct(self):
+        result = idct_regions(dct_regions(self.regions))
+
+        np.testing.assert_allclose(result.matrix, self.mx)
+
+    def test_mask(self):
+        dct_mx = dct_regions(self.regions).matrix
+        base = np.full(self.mx.shape, -1.0)
+        result = idct_regions(MatrixRegions(self.regions.rects, dct_mx), base=base, mask=[False, True] * 3)
+
+        np.testing.assert_allclose(result.matrix[0:8, 16:24], self.mx[0:8, 16:24])
+        np.testing.assert_array_equal(result.matrix[8:16, 16:24], base[8:16, 16:24])
+
+    def test_clipped_regions(self):
+        result = dct_regions(divide_into_equal_regions(self.mx, 16))
+        clipped = self.mx[16:, 16:]
+
+        np.testing.assert_array_equal(result.matrix[16:, 16:], dct(dct(clipped, norm='ortho').T, norm='ortho').T)
+
+    def test_size_classes(self):
+        classes = size_classes(self.regions.rects, self.mx.shape)
+
+        self.assertEqual(sorted(classes), [(4, 8), (8, 8), (16, 16)])
+        self.assertEqual(classes[(4, 8)][1].tolist(), [0, 8, 16])
+
+
+class TestBackends(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.stacks = [rng.rand(10, 8, 8) * 255, rng.rand(3, 32, 32) * 255, rng.rand(2, 4, 16) * 255]
+
+    def test_dct(self):
+        for name, backend in BACKENDS.items():
+            for stack in self.stacks:
+                expected = dct(dct(stack, axis=2, norm='ortho'), axis=1, norm='ortho')
+                np.testing.assert_allclose(backend.dct2(stack), expected, atol=1e-9, err_msg=name)
+                np.testing.assert_allclose(backend.idct2(expected), stack, atol=1e-9, err_msg=name)
+
+    def test_auto(self):
+        auto = get_backend(AUTO)
+        auto.dct2(self.stacks[0])
+
+        self.assertIn(auto.choices[((8, 8), False)], auto.backends)
+
+    def test_regions(self):
+        regions = MatrixRegions([(0, 0, 8, 8), (8, 0, 16, 8)], self.stacks[0][0:2].transpose((1, 0, 2)).reshape((8, 16)))
+
+        for name in BACKENDS:
+            np.testing.assert_allclose(dct_regions(regions, backend=name).matrix, dct_regions(regions).matrix,
+                                       atol=1e-9, err_msg=name)
+
+    def test_unknown(self):
+        with self.assertRaises(WrongBackendError):
+            get_backend('fftw')
@@ -3,7 +3,8 @@ from unittest import TestCase
 from numpy.testing import assert_array_equal
 import numpy as np
 
-from qtar.core.zigzag import zigzag, zigzag_embed_to_cfregions, zigzag_extract_from_cfregions
+from qtar.core.zigzag import zigzag, zigzag_order, zigzag_embed_to_cfregions, zigzag_extract_from_cfregions, \
+    interweave, distribute
 from qtar.core.matrixregion import MatrixRegions
 from qtar.core.curvefitting import CFRegions
 
@@ -19,6 +20,21 @@ class TestZigzag(TestCase):
             [10, 18, 19, 23, 24]
         ])
         assert_array_equal(actual, ideal)
+        self.assertFalse(actual.flags.writeable)
+
+    def test_zigzag_rectangular(self):
+        ideal = np.array([
+            [0, 1, 5, 6],
+            [2, 4, 7, 10],
+            [3, 8, 9, 11]
+        ])
+        assert_array_equal(zigzag((3, 4)), ideal)
+
+    def test_zigzag_order(self):
+        order = zigzag_order((3, 4))
+        ideal = zigzag((3, 4))
+
+        assert_array_equal(ideal[order[:, 0], order[:, 1]], np.arange(12))
 
     def test_zigzag_embed_to_cfregions(self):
         container = np.zeros((16, 16)).astype(int)
@@ -107,3 +123,13 @@ class TestZigzag(TestCase):
         extracted = zigzag_extract_from_cfregions(embedded, (8, 8), 4)
 
         assert_array_equal(extracted.matrix.astype(int), wm_mr.matrix)
+
+
+class TestRoundRobin(TestCase):
+    def test_interweave(self):
+        assert_array_equal(interweave([[1, 2, 3], [], [4], [5, 6]]), [1, 4, 5, 2, 6, 3])
+
+    def test_distribute(self):
+        parts = distribute(np.arange(6), [3, 0, 1, 4])
+
+        self.assertEqual([part.tolist() for part in parts], [[0, 3, 5], [], [1], [2, 4]])